@@ -1,10 +1,107 @@
+import operator
+from collections import namedtuple
 import numpy as np
 from astroedu.constants import G, au
+from .cache import tide_cache, quantise, quantise_position
+
+
+class TidalForces(namedtuple('TidalForces', ['force_c', 'force_p_h', 'force_p_h_diff',
+                                             'force_p_v', 'force_p_v_diff'])):
+    """Tidal force components, unpacks like the list returned by Body2D.forces
+
+    Fields:
+        force_c -- gravitational force at the centre of the Main body, shape (..., M)
+        force_p_h -- hor. component of grav force at each surface point, shape (..., M, n)
+        force_p_h_diff -- hor. comp. of tidal force at each surface point, shape (..., M, n)
+        force_p_v -- vert. component of grav force at each surface point, shape (..., M, n)
+        force_p_v_diff -- vert. comp. of tidal force at each surface point, shape (..., M, n)
+
+    M is the number of perturbing bodies and n the number of surface points.
+    The M axis is dropped by total().
+    """
+    __slots__ = ()
+
+    def total(self):
+        """ Returns the combined forces of all the perturbing bodies
+        """
+        return TidalForces(self.force_c.sum(axis=-1),
+                           *[f.sum(axis=-2) for f in self[1:]])
+
+
+def tidal_forces(x, y, r, m, px, py, pm, thetas, scale=1, zero_cut=0, G=G.value):
+    """ Calculates the forces on the surface points of a Main body due to M
+    perturbing bodies in one broadcast pass. Units: m, kg, N
+
+    Args:
+        x, y -- float, position of the Main body (m), or arrays broadcasting against px
+        r    -- float, radius of the Main body (m)
+        m    -- float, mass of the Main body (kg)
+        px, py -- array of floats (..., M), positions of the perturbing bodies (m),
+                  leading axes (e.g. time) are kept in the result
+        pm   -- array of floats (..., M), masses of the perturbing bodies (kg)
+        thetas -- array of floats (n,), angles of the surface points (rad)
+        scale -- float, scale to divide forces by in kg
+        zero_cut -- float, tidal components smaller than this are set to 0
+        G    -- float, gravitational constant, default astroedu.constants.G
+
+    Returns:
+        TidalForces with the forces of every body at every surface point
+
+    Example:
+        >>> f = tidal_forces(0, 0, 6371e3, 5.9724e24, [384400e3], [0], [7.346e22],
+        ...                  np.arange(0, 2*np.pi, 0.25*np.pi), scale=5.972e24)
+        >>> f.force_p_h.shape
+        (1, 8)
+    """
+    x_diff = np.asarray(px, dtype=np.float64) - x
+    y_diff = np.asarray(py, dtype=np.float64) - y
+    pm = np.asarray(pm, dtype=np.float64)
+    thetas = np.asarray(thetas, dtype=np.float64)
+
+    dist = np.hypot(x_diff, y_diff)
+    ang = np.arctan2(y_diff, x_diff)
+    ang = np.where(ang >= 0, ang, 2*np.pi + ang)
+
+    gmm = G*m*pm
+    force_c = gmm/dist**2 / scale
+
+    d = dist[..., None]
+    a = ang[..., None]
+    cos_ta = np.cos(thetas - a)
+    c = np.sqrt(r**2 + d**2 - 2*r*d*cos_ta)
+    force_p = gmm[..., None]/c**2 / scale
+    b = np.arcsin(np.clip((d - r*cos_ta)/c, -1, 1))
+    force_p_h = np.absolute(force_p*np.cos(b + a - np.pi/2))
+    force_p_v = np.absolute(force_p*np.sin(b + a - np.pi/2))
+
+    # fix the signs of our vectors, see Body2D.force_points
+    cos_a = np.cos(ang)
+    sin_a = np.sin(ang)
+    near_y = np.abs(dist*cos_a) < r
+    near_x = ~near_y & (np.abs(dist*sin_a) < r)
+    force_p_h *= np.where(near_y[..., None], np.sign(-np.cos(thetas)), np.sign(cos_a)[..., None])
+    force_p_v *= np.where(near_x[..., None], np.sign(-np.sin(thetas)), np.sign(sin_a)[..., None])
+
+    force_p_h_diff = force_p_h - (force_c*cos_a)[..., None]
+    force_p_v_diff = force_p_v - (force_c*sin_a)[..., None]
+    force_p_h_diff[np.abs(force_p_h_diff) < zero_cut] = 0
+    force_p_v_diff[np.abs(force_p_v_diff) < zero_cut] = 0
+
+    return TidalForces(force_c, force_p_h, force_p_h_diff, force_p_v, force_p_v_diff)
+
 
 class Body2D:
-    """Body object"""
+    """Body object
+
+    The name, position, radius and mass of a body are held in the arrays of a
+    BodySystem, the body being a view of one of its entries: reading or setting
+    body.x reads or writes system.positions[i, 0]. A body created on its own
+    has a system of its own and joins the arrays of a BodySystem it is added to.
+    """
+
+    __slots__ = ('_system', '_index', 'step', 'thetas', 'scale')
 
-    def __init__(self, name, x, y, r, m):
+    def __init__(self, name, x, y, r, m, vx=0, vy=0):
         """Initialises the body
 
         Args:
@@ -13,15 +110,81 @@ class Body2D:
             y    -- float, y position of the object (AU) - is converted to m
             r    -- float, radius of the object (km) - is converted to m
             m    -- float, mass of the object (kg)
+            vx   -- float, x velocity of the object (km/s) - is converted to m/s, default 0
+            vy   -- float, y velocity of the object (km/s) - is converted to m/s, default 0
 
         Example:
             >>> moon = Body2D('Moon', 0, 0, 1737.4, 0.07346*10**24)
         """
-        self.name = name
-        self.x = x*au
-        self.y = y*au
-        self.r = r*1000
-        self.m = m
+        self._system = BodySystem.from_arrays([name], [[x, y]], [r], [m], velocities=[[vx, vy]])
+        self._index = 0
+
+    @classmethod
+    def _view(cls, system, index):
+        body = cls.__new__(cls)
+        body._system = system
+        body._index = index
+        return body
+
+    @property
+    def system(self):
+        return self._system
+
+    @property
+    def name(self):
+        return self._system.names[self._index]
+
+    @name.setter
+    def name(self, value):
+        self._system.names[self._index] = value
+
+    @property
+    def x(self):
+        return self._system.positions[self._index, 0]
+
+    @x.setter
+    def x(self, value):
+        self._system.positions[self._index, 0] = value
+
+    @property
+    def y(self):
+        return self._system.positions[self._index, 1]
+
+    @y.setter
+    def y(self, value):
+        self._system.positions[self._index, 1] = value
+
+    @property
+    def vx(self):
+        return self._system.velocities[self._index, 0]
+
+    @vx.setter
+    def vx(self, value):
+        self._system.velocities[self._index, 0] = value
+
+    @property
+    def vy(self):
+        return self._system.velocities[self._index, 1]
+
+    @vy.setter
+    def vy(self, value):
+        self._system.velocities[self._index, 1] = value
+
+    @property
+    def r(self):
+        return self._system.radii[self._index]
+
+    @r.setter
+    def r(self, value):
+        self._system.radii[self._index] = value
+
+    @property
+    def m(self):
+        return self._system.masses[self._index]
+
+    @m.setter
+    def m(self, value):
+        self._system.masses[self._index] = value
 
     def __str__(self):
         return f'{self.name} at ({self.x/au:.2f}, {self.y/au:.2f}) AU with r = {self.r/1000:.2E} km and m = {self.m:.2E} kg'
@@ -153,74 +316,138 @@ class Body2D:
         force_p_v_diff[np.abs(force_p_v_diff) < zero_cut] = 0
         return [force_c, force_p_h, force_p_h_diff, force_p_v, force_p_v_diff]
 
-    def update_tides(self, key1, key2, off, offsets,  tide_vals=None, use_prev=False):
-        """ Updates the tidal forces contained in the tide_f dictionary.
+    def tide_forces(self, positions, masses, step=0.25, scale=1, zero_cut=0):
+        """Calculates the tidal forces on Main due to M bodies given as arrays,
+        all bodies and surface points in one pass. Suited to hundreds of bodies
+        and thousands of surface points.
 
-        Called by self.tides() - should not be called independently
-        If use_prev is passed as True then tide_vals is not used
+        Args:
+            positions -- array of floats (M, 2), x and y positions of the bodies (AU)
+            masses -- array of floats (M,), masses of the bodies (kg)
+            step -- float, angular step to make when calculating surface points - in terms of pi
+            scale -- float, scale to divide forces by in kg
+            zero_cut -- float, tidal components smaller than this are set to 0
+
+        Returns:
+            TidalForces with the forces of every body, shapes (M,) and (M, n),
+            use .total() for the combined forces
+
+        Example:
+            >>> f = earth.tide_forces([[384400000/au, 0], [1, 0]], [0.07346*10**24, 1988500*10**24])
+            >>> f.total().force_p_h_diff
+        """
+        self.step = step
+        self.thetas = np.arange(0, 2*np.pi, step*np.pi)
+        self.scale = scale
+        positions = np.asarray(positions, dtype=np.float64)*au.value
+        return tidal_forces(self.x, self.y, self.r, self.m, positions[..., 0], positions[..., 1],
+                            masses, self.thetas, scale=scale, zero_cut=zero_cut)
 
-        Use previously calculated values for a body if they are already in the dictionary tide_f
-        Otherwise update the tide values for the combined effect of all the bodies
-        using the passed tide_vals list which is from self.forces()
+    def iter_tide_series(self, positions, masses, step=0.25, scale=1, zero_cut=0, centres=None, chunk=64):
+        """Generator form of tide_series(), computing chunk timesteps at a time.
 
         Args:
-            key1 -- str, the final key of all tidal effects combined, eg 'Sun+Moon'
-            key2 -- str, name of the body object, eg 'Sun'
-            off -- str, offset_angle of the Body object as a string
-            offsets -- str, offset angles of all Body object combined
-                    -- eg, '0+0' for two Bodys with offset angles of 0
-            tide_vals -- NumPy array of floats from self.forces(), default None
-                      -- Is not neccessary when using use_prev=True
-            use_prev -- boolean, whether to use values already calculated in tide_f, default False
+            As tide_series(), chunk defaults to 64 timesteps
+
+        Yields:
+            t0 -- int, index of the first timestep of the chunk
+            forces -- TidalForces of the timesteps t0 to t0+chunk, shapes (chunk, M) and (chunk, M, n)
 
         Example:
-            self.update_tides(tide_f_key, body.name, this_off, tide_f_offs, use_prev=True)
-            self.update_tides(tide_f_key, body.name, this_off, tide_f_offs, tide_vals=self.forces(body))
+            >>> for t0, f in earth.iter_tide_series(positions, masses, chunk=1000):
+            ...     h_max[t0:t0+len(f.force_c)] = np.abs(f.total().force_p_h_diff).max(axis=-1)
         """
-        # check if the final key exists
-        if key1 not in self.tide_f:
-            self.tide_f[key1] = {}
-            self.tide_f[key1][offsets] = []
-        # if offsets key not in nested dictionary add it 
-        elif offsets not in self.tide_f[key1]:
-            self.tide_f[key1][offsets] = []
-        # use prev calculated values
-        if use_prev:
-            # if the final key is empty zip won't work!
-            if self.tide_f[key1][offsets] != []:                         
-                update = [new_tide+old_tide for new_tide, old_tide in zip(self.tide_f[key2][off], self.tide_f[key1][offsets])]
-                self.tide_f[key1][offsets] = update
+        self.step = step
+        self.thetas = np.arange(0, 2*np.pi, step*np.pi)
+        self.scale = scale
+
+        positions = np.asarray(positions, dtype=np.float64)
+        if positions.ndim != 3 or positions.shape[-1] != 2:
+            raise ValueError(f'positions must have shape (T, M, 2), not {positions.shape}')
+        masses = np.broadcast_to(np.asarray(masses, dtype=np.float64), positions.shape[:-1])
+        nt = positions.shape[0]
+        if chunk is None:
+            chunk = max(nt, 1)
+
+        for t0 in range(0, nt, chunk):
+            pos = positions[t0:t0+chunk]*au.value
+            if centres is None:
+                x, y = self.x, self.y
             else:
-                self.tide_f[key1][offsets] = self.tide_f[key2][off]
-        # use newly calculated values
-        else:
-            # add key for single body and its offset
-            self.tide_f[key2] = {}
-            self.tide_f[key2][off] = tide_vals
-            # If there is only 1 body the keys are the same so don't double numbers  
-            if key1!=key2: 
-                # if the final key is empty zip won't work!
-                if self.tide_f[key1][offsets] != []:                         
-                    update = [new_tide+old_tide for new_tide, old_tide in zip(tide_vals, self.tide_f[key1][offsets])]
-                    self.tide_f[key1][offsets] = update
-                else:
-                    self.tide_f[key1][offsets] = tide_vals
-
-    def tides(self, *args, step=0.25, scale=1):
+                cen = np.asarray(centres[t0:t0+chunk], dtype=np.float64)*au.value
+                x, y = cen[:, 0, None], cen[:, 1, None]
+            yield t0, tidal_forces(x, y, self.r, self.m, pos[..., 0], pos[..., 1], masses[t0:t0+chunk],
+                                   self.thetas, scale=scale, zero_cut=zero_cut)
+
+    def tide_series(self, positions, masses, step=0.25, scale=1, zero_cut=0, centres=None, chunk=None):
+        """Calculates the tidal forces on Main over a time series of positions
+        of M bodies, e.g. the Moon and the Sun over a month.
+
+        Args:
+            positions -- array of floats (T, M, 2), x and y positions of the bodies at each time (AU)
+            masses -- array of floats (M,) or (T, M), masses of the bodies (kg)
+            step -- float, angular step to make when calculating surface points - in terms of pi
+            scale -- float, scale to divide forces by in kg
+            zero_cut -- float, tidal components smaller than this are set to 0
+            centres -- array of floats (T, 2), positions of Main at each time (AU), default its position
+            chunk -- int, number of timesteps computed together to bound the memory used,
+                     default all at once
+
+        Returns:
+            TidalForces with the forces of every body at every time, shapes (T, M) and (T, M, n),
+            use .total() for the combined forces, shapes (T,) and (T, n)
+
+        Example:
+            >>> t = np.linspace(0, 29.5, 1000)*2*np.pi/29.5
+            >>> moon = 384400000/au*np.stack([np.cos(t), np.sin(t)], axis=-1)
+            >>> sun = np.broadcast_to([1, 0], moon.shape)
+            >>> f = earth.tide_series(np.stack([moon, sun], axis=1), [0.07346*10**24, 1988500*10**24])
+            >>> spring_neap = np.abs(f.total().force_p_h_diff).max(axis=-1)
+        """
+        out = None
+        for t0, forces in self.iter_tide_series(positions, masses, step=step, scale=scale, zero_cut=zero_cut,
+                                                centres=centres, chunk=chunk):
+            if out is None:
+                nt = len(positions)
+                out = [np.empty((nt,) + f.shape[1:]) for f in forces]
+            for o, f in zip(out, forces):
+                o[t0:t0+len(f)] = f
+        if out is None:
+            # empty series
+            nt, nb = np.shape(positions)[:2]
+            n = len(self.thetas)
+            out = [np.empty((nt, nb))] + [np.empty((nt, nb, n)) for i in range(4)]
+        return TidalForces(*out)
+
+    def tide_key(self, body, step, scale, zero_cut=0):
+        """ Returns the key of the tidal forces on Main due to body in the shared
+        tide_cache: the position of body relative to Main, both masses, the
+        radius of Main, step, scale and zero_cut, quantised by cache.quantise()
+        and cache.quantise_position()
+        """
+        q = quantise
+        return quantise_position(body.x - self.x, body.y - self.y) + \
+               (q(body.m), q(self.m), q(self.r), q(step), q(scale), q(zero_cut))
+
+    def tides(self, *args, step=0.25, scale=1, zero_cut=0, cache=True):
         """Calculates the tides on Main due to the bodies passed as arguments.
 
-        Checks to see whether the tidal force from each individual body has been
-        calculated previously so it doesn't repeat calculations
+        The forces of all the bodies are computed together by tidal_forces()
+        and summed. The forces of each body are kept in the LRU cache tide_cache,
+        shared by all Body2D objects, and reused for the same geometry (see
+        tide_key), e.g. when a sweep revisits a configuration.
 
         Args:
             step -- float, angular step to make when calculating surface points - in terms of pi
                  -- used to calculate the angles of each point, each point is +step*np.pi
             scale -- float, scale to divide forces by in kg
                   -- set to mass of Main object for acceleration in ms-2
-            Any number of Body class objects can then be passed.
+            zero_cut -- float, tidal components smaller than this are set to 0
+            cache -- boolean, whether to use the shared tide_cache, default True
+            Any number of Body class objects can then be passed, none giving zero forces.
 
         Returns:
-            A list containing:
+            TidalForces containing:
             force_c -- float, the gravitational force at the centre of the Main body due to bodies
             force_p_h -- NumPy array of floats, hor. component of grav force at each surface point
             force_p_h_diff -- NumPy array of floats, hor. comp. of tidal force at each surface point
@@ -229,34 +456,175 @@ class Body2D:
 
         Example:
             >>> forces = earth.tides(moon, step=0.25, scale=5.972*10**24)
-            >>> print(forces)
-            [3.31874952061913e-05, array([3.43155527e-05, 3.39721024e-05, 3.31738253e-05, 3.24165524e-05,
-             3.21141611e-05, 3.24165524e-05, 3.31738253e-05, 3.39721024e-05]), array([ 1.12805754e-06,  7.84607232e-07,  0.00000000e+00, -7.70942821e-07,
-             -1.07333414e-06, -7.70942821e-07,  0.00000000e+00,  7.84607232e-07]), array([ 0.00000000e+00, -4.02857477e-07, -5.49819045e-07, -3.75505178e-07,
-             -0.00000000e+00,  3.75505178e-07,  5.49819045e-07,  4.02857477e-07]), array([ 0.00000000e+00, -4.02857477e-07, -5.49819045e-07, -3.75505178e-07,
-             0.00000000e+00,  3.75505178e-07,  5.49819045e-07,  4.02857477e-07])]
+            >>> force_c, force_p_h, force_p_h_diff, force_p_v, force_p_v_diff = forces
+            >>> print(forces.force_p_h)
+            [3.43111679e-05 3.39677614e-05 3.31695863e-05 3.24124102e-05
+             3.21100575e-05 3.24124102e-05 3.31695863e-05 3.39677614e-05]
         """
         self.step = step              # in terms of pi
         self.thetas = np.arange(0, 2*np.pi, step*np.pi)
         self.scale = scale
-        self.tide_f = {
-
-        }
-        # get all body names then join them to make the dictionary key
-        body_names = [body.name for body in args]
-        tide_f_key = "+".join(body_names)
-        # get all offset angles then join them to make the nested dictionary key
-        list_offsets = [str(self.angle_to(body)) for body in args]
-        tide_f_offs = "+".join(list_offsets)
-        for body in args:
-            this_off = str(self.angle_to(body))
-            # if the tidal force for this body has been calculated before use stored values
-            if body.name in self.tide_f:
-                # check if the calculated values were for the same offset_angle
-                if this_off in self.tide_f[body.name]:
-                    self.update_tides(tide_f_key, body.name, this_off, tide_f_offs, use_prev=True)
-            # else calculate the tidal force from the new body and pass it to self.update_tides()
-            else:
-                this_body_tide = self.forces(body)
-                self.update_tides(tide_f_key, body.name, this_off, tide_f_offs, tide_vals=this_body_tide)
-        return self.tide_f[tide_f_key][tide_f_offs]
\ No newline at end of file
+        if not cache or not args:
+            # with no bodies, tidal_forces() gives zero forces
+            return tidal_forces(self.x, self.y, self.r, self.m, [body.x for body in args],
+                                [body.y for body in args], [body.m for body in args], self.thetas,
+                                scale=scale, zero_cut=zero_cut).total()
+
+        keys = [self.tide_key(body, step, scale, zero_cut) for body in args]
+        per_body = [tide_cache.lookup(key) for key in keys]
+        missing = [i for i, f in enumerate(per_body) if f is None]
+        if missing:
+            new = tidal_forces(self.x, self.y, self.r, self.m, [args[i].x for i in missing],
+                               [args[i].y for i in missing], [args[i].m for i in missing], self.thetas,
+                               scale=scale, zero_cut=zero_cut)
+            for j, i in enumerate(missing):
+                per_body[i] = tide_cache.store(keys[i], TidalForces(*[f[j] for f in new]))
+        return TidalForces(*[np.stack(f) for f in zip(*per_body)]).total()
+
+
+class BodySystem:
+    """Collection of bodies stored in contiguous NumPy arrays:
+
+        names -- array of objects (N,), names of the bodies
+        positions -- array of floats (N, 2), x and y positions (m)
+        velocities -- array of floats (N, 2), x and y velocities (m/s)
+        radii -- array of floats (N,), radii (m)
+        masses -- array of floats (N,), masses (kg)
+
+    Indexing or iterating gives Body2D views of the entries, which read and
+    write the arrays. Distances, angles and forces between all pairs of bodies
+    are computed in one pass.
+
+    Example:
+        >>> system = BodySystem(Body2D.Sun(0, 0), Body2D.Earth(1, 0), Body2D.Moon(1 + 384400000/au, 0))
+        >>> system[1].x += 1000          # moves Earth by 1 km, same as system.positions[1, 0] += 1000
+        >>> system.forces()[1, 2]        # force between Earth and Moon
+    """
+
+    __slots__ = ('names', 'positions', 'velocities', 'radii', 'masses')
+
+    def __init__(self, *bodies):
+        """Initialises the system with copies of the bodies passed, which become
+        views of the system (see add)
+        """
+        self.names = np.empty(0, dtype=object)
+        self.positions = np.empty((0, 2))
+        self.velocities = np.empty((0, 2))
+        self.radii = np.empty(0)
+        self.masses = np.empty(0)
+        self.add(*bodies)
+
+    @classmethod
+    def from_arrays(cls, names, positions, radii, masses, velocities=None):
+        """ Returns a system of bodies given as arrays, units as Body2D
+
+        Args:
+            names -- list of strings (N,), names of the bodies
+            positions -- array of floats (N, 2), x and y positions (AU)
+            radii -- array of floats (N,), radii (km)
+            masses -- array of floats (N,), masses (kg)
+            velocities -- array of floats (N, 2), x and y velocities (km/s), default 0
+        """
+        system = cls()
+        system.names = np.array(names, dtype=object).reshape(-1)
+        system.positions = np.array(positions, dtype=np.float64).reshape(-1, 2)*au.value
+        system.radii = np.array(radii, dtype=np.float64).reshape(-1)*1000
+        system.masses = np.array(masses, dtype=np.float64).reshape(-1)
+        if velocities is None:
+            system.velocities = np.zeros_like(system.positions)
+        else:
+            system.velocities = np.array(velocities, dtype=np.float64).reshape(-1, 2)*1000
+        return system
+
+    def add(self, *bodies):
+        """ Appends the bodies passed to the arrays. Each body then becomes a
+        view of the system, so setting its attributes changes the arrays.
+        """
+        if not bodies:
+            return
+        n = len(self)
+        names = np.empty(len(bodies), dtype=object)
+        names[:] = [b.name for b in bodies]
+        self.names = np.concatenate([self.names, names])
+        self.positions = np.concatenate([self.positions, [(b.x, b.y) for b in bodies]])
+        self.velocities = np.concatenate([self.velocities, [(b.vx, b.vy) for b in bodies]])
+        self.radii = np.concatenate([self.radii, [b.r for b in bodies]])
+        self.masses = np.concatenate([self.masses, [b.m for b in bodies]])
+        for i, body in enumerate(bodies):
+            body._system = self
+            body._index = n + i
+
+    def __len__(self):
+        return len(self.masses)
+
+    def __getitem__(self, i):
+        """ Returns the Body2D view of body i, an integer
+        """
+        try:
+            i = operator.index(i)
+        except TypeError:
+            raise TypeError(f'BodySystem indices must be integers, not {type(i).__name__}') from None
+        return Body2D._view(self, range(len(self))[i])
+
+    def __iter__(self):
+        return (Body2D._view(self, i) for i in range(len(self)))
+
+    def __repr__(self):
+        return f'BodySystem({", ".join(repr(body) for body in self)})'
+
+    def separations(self):
+        """ Returns x_diff, y_diff, arrays of floats (N, N), the position of
+        body j relative to body i in element [i, j] (m)
+        """
+        x, y = self.positions[:, 0], self.positions[:, 1]
+        return x[None, :] - x[:, None], y[None, :] - y[:, None]
+
+    def distances(self):
+        """ Returns the distances between all bodies, array of floats (N, N) (m),
+        element [i, j] as self[i].distance_to(self[j])
+        """
+        return np.hypot(*self.separations())
+
+    def angles(self):
+        """ Returns the angles offset from +x axis counterclockwise of all bodies
+        seen from each other, array of floats (N, N) in [0, 2pi), element [i, j]
+        as self[i].angle_to(self[j])
+        """
+        x_diff, y_diff = self.separations()
+        ang = np.arctan2(y_diff, x_diff)
+        return np.where(ang >= 0, ang, 2*np.pi + ang)
+
+    def forces(self, scale=1):
+        """ Returns the gravitational forces between all bodies, array of floats
+        (N, N), element [i, j] as self[i].force_centre(self[j]) and 0 on the
+        diagonal. Unit: N
+
+        Args:
+            scale -- float, scale to divide forces by in kg
+        """
+        dist = self.distances()
+        np.fill_diagonal(dist, np.inf)
+        return G.value*self.masses[:, None]*self.masses[None, :]/dist**2 / scale
+
+    def net_forces(self, scale=1):
+        """ Returns the x and y components of the total gravitational force on
+        each body due to all the others, array of floats (N, 2). Unit: N
+        """
+        x_diff, y_diff = self.separations()
+        dist = np.hypot(x_diff, y_diff)
+        np.fill_diagonal(dist, np.inf)
+        f = G.value*self.masses[:, None]*self.masses[None, :]/dist**3 / scale
+        return np.stack([(f*x_diff).sum(axis=1), (f*y_diff).sum(axis=1)], axis=-1)
+
+    def tides(self, i, step=0.25, scale=1, zero_cut=0):
+        """ Returns the tidal forces on body i due to all the other bodies,
+        TidalForces with the forces of every other body, see Body2D.tide_forces
+        """
+        main = self[i]
+        main.step = step
+        main.thetas = np.arange(0, 2*np.pi, step*np.pi)
+        main.scale = scale
+        others = np.arange(len(self)) != main._index
+        return tidal_forces(main.x, main.y, main.r, main.m, self.positions[others, 0],
+                            self.positions[others, 1], self.masses[others], main.thetas,
+                            scale=scale, zero_cut=zero_cut)
@@ -1 +1,3 @@
-from .Body import Body2D
\ No newline at end of file
+from .Body import Body2D, BodySystem
+from .cache import tide_cache
+from .integrator import Integrator
@@ -0,0 +1,29 @@
+import numpy as np
+from astroedu.lru import LRUCache
+
+# Significant digits kept in the keys of tide_cache
+
+KEY_DIGITS = 12
+
+
+def quantise(value, digits=KEY_DIGITS):
+    """ Returns value rounded to digits significant digits, so that
+    geometries differing only by round-off share a key
+    """
+    return float(f'{value:.{digits}g}')
+
+
+def quantise_position(x, y, digits=KEY_DIGITS):
+    """ Returns the vector (x, y) rounded to digits significant digits
+    of its length, so that a component of the order of round-off is 0
+    """
+    dist = np.hypot(x, y)
+    if dist == 0:
+        return (0, 0, 0.)
+    quantum = 10.**(np.floor(np.log10(dist)) - digits + 1)
+    return (int(round(x/quantum)), int(round(y/quantum)), float(quantum))
+
+
+# Tidal forces of single bodies, shared by all Body2D objects
+
+tide_cache = LRUCache(maxbytes=64*2**20)
@@ -0,0 +1,173 @@
+from collections import namedtuple
+import numpy as np
+from astroedu.constants import G
+
+
+def accelerations(positions, masses, softening=0, G=G.value, tmin=False):
+    """ Calculates the gravitational acceleration of every body due to all
+    the others, all pairs in one pass. Units: m, kg, s
+
+    Args:
+        positions -- array of floats (N, 2), x and y positions (m)
+        masses -- array of floats (N,), masses (kg)
+        softening -- float, softening length added to the distances (m), default 0
+        G -- float, gravitational constant, default astroedu.constants.G
+        tmin -- boolean, whether to also return the shortest free-fall time
+                sqrt(d**3/(G*(m_i + m_j))) of all pairs (s), inf without
+                interacting pairs
+
+    Returns:
+        acc -- array of floats (N, 2), x and y accelerations (ms-2)
+        (tmin -- float, if tmin is True)
+    """
+    x = np.ascontiguousarray(positions[:, 0])
+    y = np.ascontiguousarray(positions[:, 1])
+    x_diff = np.subtract.outer(x, x)         # x_i - x_j
+    y_diff = np.subtract.outer(y, y)
+    d2 = x_diff*x_diff
+    d2 += y_diff*y_diff
+    d2 += softening**2
+    d2.flat[::len(masses)+1] = np.inf
+    inv_d3 = np.sqrt(d2)
+    inv_d3 *= d2
+    np.divide(1, inv_d3, out=inv_d3)
+    if tmin:
+        rate = G*(inv_d3*(masses[:, None] + masses[None, :])).max(initial=0)
+        t = np.sqrt(1/rate) if rate > 0 else np.inf
+    inv_d3 *= -G*masses
+    acc = np.stack([np.einsum('ij,ij->i', x_diff, inv_d3), np.einsum('ij,ij->i', y_diff, inv_d3)], axis=-1)
+    if tmin:
+        return acc, t
+    return acc
+
+
+def energy(positions, velocities, masses, softening=0, G=G.value):
+    """ Returns the total energy, kinetic plus potential, of a set of bodies (J)
+    """
+    kinetic = 0.5*(masses*(velocities**2).sum(axis=-1)).sum()
+    x_diff = positions[None, :, 0] - positions[:, None, 0]
+    y_diff = positions[None, :, 1] - positions[:, None, 1]
+    i, j = np.triu_indices(len(masses), k=1)
+    d = np.sqrt(x_diff[i, j]**2 + y_diff[i, j]**2 + softening**2)
+    return kinetic - G*(masses[i]*masses[j]/d).sum()
+
+
+class Snapshots(namedtuple('Snapshots', ['times', 'positions', 'velocities', 'energies'])):
+    """Snapshots of an integration
+
+    Fields:
+        times -- array of floats (S,), times of the snapshots (s)
+        positions -- array of floats (S, N, 2), x and y positions (m)
+        velocities -- array of floats (S, N, 2), x and y velocities (m/s)
+        energies -- array of floats (S,), total energy (J)
+    """
+    __slots__ = ()
+
+    def energy_error(self):
+        """ Returns the relative energy error |E - E0|/|E0| of every snapshot
+        """
+        return np.abs(self.energies - self.energies[0])/np.abs(self.energies[0])
+
+
+class Integrator:
+    """Symplectic integrator of the motion of the bodies of a BodySystem under
+    their mutual gravity. The positions and velocities are advanced in place
+    in the arrays of the system, so its Body2D views follow the motion.
+
+    Methods:
+        'leapfrog' -- kick-drift-kick leapfrog, second order
+        'yoshida' -- fourth order composition of three leapfrog steps (Yoshida 1990)
+
+    With a fixed timestep the energy error stays bounded over long runs. The
+    adaptive mode sets each step to eta times the shortest free-fall time of
+    all pairs of bodies, which follows close encounters but is no longer
+    exactly symplectic.
+
+    Example:
+        >>> system = BodySystem(Body2D.Sun(0, 0), Body2D('Earth', 1, 0, 6371, 5.9724*10**24, vy=29.78))
+        >>> snaps = Integrator(system, method='yoshida').run(365*24, dt=3600, every=24)
+        >>> snaps.positions[:, 1]          # daily positions of Earth over a year
+        >>> snaps.energy_error().max()
+    """
+
+    weights = {'leapfrog': [1.],
+               'yoshida': [1/(2 - 2**(1/3)), -2**(1/3)/(2 - 2**(1/3)), 1/(2 - 2**(1/3))]}
+
+    def __init__(self, system, method='leapfrog', softening=0):
+        """Initialises the integrator
+
+        Args:
+            system -- BodySystem, the bodies to evolve
+            method -- string, 'leapfrog' or 'yoshida', default 'leapfrog'
+            softening -- float, softening length of the forces (m), default 0
+        """
+        if method not in self.weights:
+            raise ValueError(f'Unknown method {method}, use one of {list(self.weights)}')
+        self.system = system
+        self.method = method
+        self.softening = softening
+        self.time = 0.
+
+    def _accelerations(self, tmin=False):
+        acc = accelerations(self.system.positions, self.system.masses,
+                            softening=self.softening, tmin=tmin)
+        return acc if tmin else (acc, None)
+
+    def energy(self):
+        """ Returns the total energy of the system (J)
+        """
+        return energy(self.system.positions, self.system.velocities, self.system.masses,
+                      softening=self.softening)
+
+    def run(self, nsteps, dt=None, eta=None, every=1):
+        """ Advances the system by nsteps steps and returns snapshots taken
+        every few steps, the first one being the initial state
+
+        Args:
+            nsteps -- int, number of steps
+            dt -- float, timestep (s), the largest timestep in adaptive mode
+            eta -- float, adaptive mode: each timestep is eta times the shortest
+                   free-fall time of all pairs, e.g. 0.01. dt is used when no
+                   pair of bodies interacts, e.g. for a single body
+            every -- int, number of steps between snapshots, default 1
+
+        Returns:
+            Snapshots, preallocated for nsteps//every + 1 snapshots
+        """
+        if dt is None and eta is None:
+            raise ValueError('Give a timestep dt, an adaptive timestep factor eta or both')
+        if dt is None:
+            dt = np.inf
+
+        x = self.system.positions
+        v = self.system.velocities
+        nsnap = nsteps//every + 1
+        snaps = Snapshots(np.empty(nsnap), np.empty((nsnap,) + x.shape),
+                          np.empty((nsnap,) + v.shape), np.empty(nsnap))
+
+        def snapshot(k):
+            snaps.times[k] = self.time
+            snaps.positions[k] = x
+            snaps.velocities[k] = v
+            snaps.energies[k] = self.energy()
+
+        snapshot(0)
+        weights = self.weights[self.method]
+        adaptive = eta is not None
+        acc, tmin = self._accelerations(tmin=adaptive)
+
+        for step in range(1, nsteps + 1):
+            h = dt if tmin is None else min(dt, eta*tmin)
+            if not np.isfinite(h):
+                raise ValueError('No interacting pair of bodies sets the adaptive timestep, '
+                                 'give a largest timestep dt')
+            for w in weights:
+                v += 0.5*w*h*acc
+                x += w*h*v
+                acc, tmin = self._accelerations(tmin=adaptive)
+                v += 0.5*w*h*acc
+            self.time += h
+            if step % every == 0:
+                snapshot(step//every)
+
+        return snaps
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class LRUCache:
+    ''' Least recently used cache of NumPy arrays, bounded by the total number
+    of bytes it holds. Values are arrays or tuples of arrays (and NumPy
+    scalars) and are made read-only, since they are shared by every caller.
+    Used by the basis tables of planetmagfields and the tides of classes.
+
+    Args:
+        maxbytes -- int, maximum size of the cache in bytes, 0 disables it
+
+    Example:
+        >>> cache = LRUCache(maxbytes=64*2**20)
+        >>> plm = cache.get(('plm',lmax,ntheta), lambda: get_plm(lmax,theta))
+        >>> cache.info()
+    '''
+
+    def __init__(self, maxbytes=256*2**20):
+        self.maxbytes = maxbytes
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(value):
+        if isinstance(value, tuple):
+            return sum(np.asarray(v).nbytes for v in value)
+        return value.nbytes
+
+    @staticmethod
+    def _freeze(value):
+        for v in (value if isinstance(value, tuple) else (value,)):
+            if isinstance(v, np.ndarray):
+                v.setflags(write=False)
+        return value
+
+    def lookup(self, key):
+        ''' Returns the value stored under key, None if it is not in the cache
+        '''
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def store(self, key, value):
+        ''' Stores value under key, evicting the least recently used entries
+        beyond maxbytes, and returns it read-only
+        '''
+        value = self._freeze(value)
+        size = self._size(value)
+        with self._lock:
+            if key not in self._data and size <= self.maxbytes:
+                self._data[key] = value
+                self.nbytes += size
+                self._evict()
+        return value
+
+    def get(self, key, func):
+        ''' Returns the value stored under key, computing it with func() and
+        storing it if it is not in the cache
+        '''
+        value = self.lookup(key)
+        if value is None:
+            value = self.store(key, func())
+        return value
+
+    def _evict(self):
+        while self.nbytes > self.maxbytes and self._data:
+            key, value = self._data.popitem(last=False)
+            self.nbytes -= self._size(value)
+            self.evictions += 1
+
+    def resize(self, maxbytes):
+        with self._lock:
+            self.maxbytes = maxbytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._data),
+                    'nbytes': self.nbytes,
+                    'maxbytes': self.maxbytes}
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 from .planet import planet
+from .igrf import igrf
 from .potextra import extrapot
+from .animate import fieldanim
 
 __version__ = '1.0.2'
\ No newline at end of file
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import matplotlib.colors as colors
+from .plotlib import proj_coords, proj_edges, get_projection, get_bmax
+
+
+class fieldanim:
+
+    '''
+    Frames of an animation of the radial field, e.g. a radius sweep, the
+    IGRF epochs or a sweep of filters. The figure, the axes, the colorbar
+    and the projected grid are set up once; every frame only replaces the
+    data of the mesh (mode='mesh') or the filled contours (mode='contour').
+    The figure is drawn off-screen with the Agg canvas.
+
+    Example:
+        >>> e = igrf()
+        >>> dates = np.linspace(1900,2020,500)
+        >>> Br = e.Br(dates)
+        >>> anim = fieldanim(e.p2D,e.th2D,vmax=np.abs(Br).max(),proj='hammer')
+        >>> anim.save_frames(Br,'frames/earth_%04d.png',
+        ...                  titles=['Earth %.1f' %t for t in dates])
+    '''
+
+    def __init__(self,p2D,th2D,vmax,proj='Mollweide',cmap='RdBu_r',mode='mesh',levels=60,
+                 figsize=(12,6.75),dpi=100,coastlines=False,label=r'Radial magnetic field ($\mu$T)'):
+
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        try:
+            import cartopy.crs as ccrs
+        except:
+            print("cartopy library not available, using Hammer projection")
+            proj = 'hammer'
+
+        self.proj = proj
+        self.mode = mode
+        self.cmap = cmap
+
+        bmax = get_bmax(vmax)
+        self.norm = colors.TwoSlopeNorm(vmin=-bmax, vcenter=0, vmax=bmax)
+        self.cs = np.linspace(-bmax,bmax,levels)
+
+        self.xx, self.yy, self.transform = proj_coords(p2D,th2D,proj=proj)
+        self.kw = {} if self.transform is None else {'transform': self.transform}
+
+        self.fig = Figure(figsize=figsize,dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+
+        if proj.lower() == 'hammer':
+            self.ax = self.fig.add_subplot(1,1,1)
+        else:
+            self.ax = self.fig.add_subplot(1,1,1,projection=get_projection(proj))
+            if coastlines:
+                self.ax.coastlines()
+
+        zero = np.zeros(self.xx.shape)
+
+        if mode == 'mesh':
+            xe, ye, transform = proj_edges(p2D,th2D,proj=proj)
+            kw = {} if transform is None else {'transform': transform}
+            self.art = self.ax.pcolormesh(xe,ye,zero,cmap=cmap,norm=self.norm,
+                                          shading='flat',**kw)
+        else:
+            self.art = self._contour(zero)
+
+        cbar = self.fig.colorbar(self.art,ax=self.ax,orientation='horizontal',fraction=0.06,
+                                 pad=0.04,ticks=[-bmax,0,bmax])
+        cbar.ax.set_xlabel(label,fontsize=25)
+        cbar.ax.tick_params(labelsize=20)
+
+        self.title = self.ax.set_title('',fontsize=25,pad=20)
+        self.ax.axis('equal')
+        self.ax.axis('off')
+        self.fig.tight_layout()
+
+    def _contour(self,B):
+
+        return self.ax.contourf(self.xx,self.yy,B,self.cs,cmap=self.cmap,norm=self.norm,
+                                extend='both',**self.kw)
+
+    def update(self,B,title=None):
+
+        '''
+        Replace the field shown by B (same grid) and the title
+        '''
+
+        if self.mode == 'mesh':
+            self.art.set_array(np.asarray(B).ravel())
+        else:
+            try:
+                self.art.remove()
+            except AttributeError:   # matplotlib < 3.8
+                for c in self.art.collections:
+                    c.remove()
+            self.art = self._contour(B)
+
+        if title is not None:
+            self.title.set_text(title)
+
+    def frame(self,B,title=None):
+
+        '''
+        RGBA image [height, width, 4] of the frame showing B
+        '''
+
+        self.update(B,title=title)
+        self.canvas.draw()
+
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def save_frames(self,fields,pattern,titles=None,start=0):
+
+        '''
+        Write one image per field, fields[k] going to pattern %(start+k),
+        e.g. pattern='frames/field_%04d.png'
+        '''
+
+        for k, B in enumerate(fields):
+            self.update(B,title=None if titles is None else titles[k])
+            self.fig.savefig(pattern %(start+k))
+
+    def pipe(self,fields,cmd,titles=None):
+
+        '''
+        Write raw RGBA frames to the standard input of the command cmd,
+        e.g. ffmpeg_cmd('movie.mp4',anim.size)
+        '''
+
+        import subprocess
+
+        proc = subprocess.Popen(cmd,stdin=subprocess.PIPE)
+
+        try:
+            for k, B in enumerate(fields):
+                proc.stdin.write(self.frame(B,title=None if titles is None else titles[k]).tobytes())
+        finally:
+            proc.stdin.close()
+            proc.wait()
+
+    @property
+    def size(self):
+
+        '''
+        Frame size (width, height) in pixels
+        '''
+
+        w, h = self.canvas.get_width_height()
+
+        return w, h
+
+
+def ffmpeg_cmd(filename,size,fps=25):
+
+    '''
+    ffmpeg command encoding raw RGBA frames of the given size
+    (width, height) read from a pipe into filename
+    '''
+
+    return ['ffmpeg','-y','-f','rawvideo','-pix_fmt','rgba','-s','%dx%d' %size,
+            '-r','%d' %fps,'-i','-','-pix_fmt','yuv420p',filename]
+
+def _save_block(args):
+
+    fields, pattern, titles, start, init = args
+    anim = fieldanim(*init[0],**init[1])
+    anim.save_frames(fields,pattern,titles=titles,start=start)
+
+def render_frames(fields,p2D,th2D,pattern,titles=None,vmax=None,nworkers=None,**kwargs):
+
+    '''
+    Write the frames of fields [nframes, nphi, ntheta] as an image
+    sequence with a pool of nworkers processes (default: number of
+    cores). Every worker sets up one fieldanim (kwargs are passed on to
+    it) and renders a contiguous block of frames. vmax defaults to the
+    largest absolute value of all frames.
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    if vmax is None:
+        vmax = np.abs(fields).max()
+    if nworkers is None:
+        nworkers = os.cpu_count()
+
+    nframes = len(fields)
+    bounds = np.linspace(0,nframes,min(nworkers,nframes)+1).astype(int)
+    init = ((p2D,th2D,vmax),kwargs)
+
+    blocks = [(fields[i:j], pattern, None if titles is None else titles[i:j], i, init)
+              for i, j in zip(bounds[:-1],bounds[1:])]
+
+    with ProcessPoolExecutor(max_workers=nworkers) as pool:
+        list(pool.map(_save_block,blocks))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import warnings
+import numpy as np
+from .libgauss import get_igrf, get_grid_shared, getB, get_spec, get_dipolarity
+from .utils import stdDatDir
+
+
+def decimal_year(dates):
+
+    '''
+    Convert dates (decimal years, datetime/date objects or numpy
+    datetime64, possibly mixed) to an array of decimal years
+    '''
+
+    from datetime import date, datetime
+
+    dates = np.atleast_1d(dates)
+
+    if np.issubdtype(dates.dtype,np.datetime64):
+        years = dates.astype('datetime64[Y]')
+        start = years.astype('datetime64[s]')
+        end = (years + 1).astype('datetime64[s]')
+        frac = (dates.astype('datetime64[s]') - start) / (end - start)
+        return years.astype(np.int64) + 1970 + frac
+
+    if dates.dtype == object:
+        out = np.zeros(len(dates))
+        for k, d in enumerate(dates):
+            if isinstance(d,(date,datetime,np.datetime64)):
+                out[k] = decimal_year(np.datetime64(d))[0]
+            else:
+                out[k] = d
+        return out
+
+    return np.asarray(dates,dtype=np.float64)
+
+
+class igrf:
+
+    '''
+    Time dependent field of Earth from all epochs of the IGRF model.
+    Coefficients are linearly interpolated between epochs and extrapolated
+    with the secular variation after the last one, which is valid for
+    sv_years (5) years: later dates give a warning. Fields for a vector of
+    dates are synthesised in one batched pass on the shared grid.
+
+    Example:
+        >>> e = igrf()
+        >>> Br = e.Br(np.arange(1950,2021,0.5))   # [ndates, nphi, ntheta]
+        >>> dBr = e.SV(2000)                      # secular variation map
+    '''
+
+    sv_years = 5
+
+    def __init__(self,nphi=256,datDir=stdDatDir):
+
+        self.name = 'earth'
+        self.nphi = nphi
+        self.ntheta = nphi//2
+
+        self.epochs, self.glm_ep, self.hlm_ep, self.glm_sv, self.hlm_sv, self.lmax, self.idx = \
+                get_igrf(datDir)
+
+        self.p2D, self.th2D = get_grid_shared(nphi=self.nphi,ntheta=self.ntheta)
+        self.phi = self.p2D[:,0]
+        self.theta = self.th2D[0,:]
+
+    def coeffs(self,dates,sv=False):
+
+        '''
+        Gauss coefficients glm, hlm (nT) at the given dates, shape
+        [ndates, nlm]. With sv=True, their secular variation (nT/yr)
+        is returned instead.
+        '''
+
+        t = decimal_year(dates)
+
+        if np.any(t < self.epochs[0]):
+            raise ValueError("IGRF dates must be >= %d" %self.epochs[0])
+
+        tmax = self.epochs[-1] + self.sv_years
+        if np.any(t > tmax):
+            warnings.warn("IGRF secular variation extrapolated beyond %g, its validity "
+                          "ends at %g" %(t.max(),tmax))
+
+        nep = len(self.epochs)
+        i = np.clip(np.searchsorted(self.epochs,t,side='right') - 1, 0, nep-2)
+        dt = self.epochs[i+1] - self.epochs[i]
+        after = t > self.epochs[-1]
+
+        out = []
+
+        for C, Csv in [(self.glm_ep,self.glm_sv), (self.hlm_ep,self.hlm_sv)]:
+            slope = (C[i+1] - C[i]) / dt[:,None]
+            slope[after] = Csv
+
+            if sv:
+                out.append(slope)
+            else:
+                c = C[i] + (t - self.epochs[i])[:,None] * slope
+                c[after] = C[-1] + (t[after] - self.epochs[-1])[:,None] * Csv
+                out.append(c)
+
+        return out[0], out[1]
+
+    def Br(self,dates,r=1):
+
+        '''
+        Radial magnetic field (micro Tesla) at radius r for every date,
+        shape [ndates, nphi, ntheta]
+        '''
+
+        glm, hlm = self.coeffs(dates)
+
+        return 1e-3 * getB(self.lmax,glm,hlm,self.idx,r,self.p2D,self.th2D,planet=self.name)
+
+    def SV(self,dates,r=1):
+
+        '''
+        Secular variation of the radial field (micro Tesla per year) at
+        radius r for every date, shape [ndates, nphi, ntheta]
+        '''
+
+        glm, hlm = self.coeffs(dates,sv=True)
+
+        return 1e-3 * getB(self.lmax,glm,hlm,self.idx,r,self.p2D,self.th2D,planet=self.name)
+
+    def spec(self,dates,r=1):
+
+        '''
+        Lowes spectrum for every date and radius, shape
+        [ndates, nr, lmax+1] (no radius axis for a single r), with the
+        dipolarity and dip_tot of each
+        '''
+
+        glm, hlm = self.coeffs(dates)
+        E, emag_10 = get_spec(glm,hlm,self.idx,self.lmax,planet=self.name,r=r)
+        dipolarity, dip_tot = get_dipolarity(E,emag_10)
+
+        return E, dipolarity, dip_tot
@@ -3,14 +3,47 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-from .libgauss import get_grid,getB,getBm0
+from .libgauss import get_grid_shared,getB,getBm0,get_data,get_spec,get_dipolarity,pad_coeffs,getBplanets,getBtiled
 from .plotlib import *
 from .utils import planetlist, stdDatDir
+from .libcache import disk_cache, field_key
 
 
-def getBr(planet, r=1, nphi=256, ntheta=128, info=True):
+def get_dipole(planet):
 
-    p2D,th2D = get_grid(nphi=nphi,ntheta=ntheta)
+    '''
+    Dipole tilt and longitude (degrees) from the Gauss coefficients
+    '''
+
+    if planet.name in ["mercury", "saturn"]:
+        dipTheta = 0.
+        dipPhi = 0.
+    else:
+        dipTheta = np.arctan(np.sqrt(planet.glm[planet.idx[1,1]]**2 + planet.hlm[planet.idx[1,1]]**2)
+                                    /planet.glm[planet.idx[1,0]]) * 180./np.pi
+        dipPhi = np.arctan(planet.hlm[planet.idx[1,1]]/planet.glm[planet.idx[1,1]]) * 180./np.pi
+
+    return dipTheta, dipPhi
+
+def print_info(planet,dipTheta):
+
+    print(("Planet: %s" %planet.name.capitalize()))
+    #print(("Depth (fraction of surface radius) = %.2f" %r))
+    print(("l_max = %d" %planet.lmax))
+    print(("Dipole tilt (degrees) = %f" %dipTheta))
+
+def synthBr(planet, r, p2D, th2D):
+
+    '''
+    Radial field (micro Tesla) of a planet at radius r on the grid p2D, th2D,
+    through the on-disk field cache when it is enabled
+    '''
+
+    key = field_key('Br',planet.name,planet.glm,planet.hlm,p2D[:,0],th2D[0,:],float(r))
+
+    return disk_cache.get(key, lambda: _synthBr(planet,r,p2D,th2D))
+
+def _synthBr(planet, r, p2D, th2D):
 
     if planet.name in ["mercury", "saturn"]:
         Br = getBm0(planet.lmax,
@@ -18,8 +51,6 @@ def getBr(planet, r=1, nphi=256, ntheta=128, info=True):
                     r,
                     p2D,
                     th2D) * 1e-3
-        dipTheta = 0.
-        dipPhi = 0.
     else:
         Br = getB(planet.lmax,
                   planet.glm,
@@ -30,19 +61,195 @@ def getBr(planet, r=1, nphi=256, ntheta=128, info=True):
                   th2D,
                   planet=planet.name) * 1e-3
 
-        dipTheta = np.arctan(np.sqrt(planet.glm[planet.idx[1,1]]**2 + planet.hlm[planet.idx[1,1]]**2)
-                                    /planet.glm[planet.idx[1,0]]) * 180./np.pi
-        dipPhi = np.arctan(planet.hlm[planet.idx[1,1]]/planet.glm[planet.idx[1,1]]) * 180./np.pi
+    return Br
+
+def getBr(planet, r=1, nphi=256, ntheta=128, info=True):
+
+    p2D,th2D = get_grid_shared(nphi=nphi,ntheta=ntheta)
+
+    Br = synthBr(planet, r, p2D, th2D)
+    dipTheta, dipPhi = get_dipole(planet)
 
     if info:
-        print(("Planet: %s" %planet.name.capitalize()))
-        #print(("Depth (fraction of surface radius) = %.2f" %r))
-        print(("l_max = %d" %planet.lmax))
-        print(("Dipole tilt (degrees) = %f" %dipTheta))
+        print_info(planet,dipTheta)
 
     return p2D, th2D, Br, dipTheta, dipPhi
 
-def plotAllFields(datDir=stdDatDir,r=1.0,levels=30,cmap='RdBu_r',proj='Mollweide'):
+def stack_planets(names=planetlist,datDir=stdDatDir):
+
+    '''
+    Gauss coefficients of several planets padded to their largest lmax,
+    as arrays G, H of shape [nplanets, nlm] with the sign convention of
+    every planet applied (see libgauss.pad_coeffs). Returns G, H, lmax.
+    '''
+
+    data = [get_data(datDir,planet=name) for name in names]
+    lmax = max(int(d[2]) for d in data)
+
+    padded = [pad_coeffs(glm,hlm,lmax_p,idx,lmax,planet=name)
+              for name, (glm,hlm,lmax_p,idx) in zip(names,data)]
+
+    G = np.stack([g for g, h in padded])
+    H = np.stack([h for g, h in padded])
+
+    return G, H, lmax
+
+def synthBr_all(names=planetlist,r=1,datDir=stdDatDir,nphi=256):
+
+    '''
+    Radial field (micro Tesla) of several planets at radius r (one value
+    or one per planet) on the shared grid, computed in a single synthesis
+    of the padded coefficients. Returns p2D, th2D and Br of shape
+    [nplanets, nphi, ntheta].
+    '''
+
+    p2D, th2D = get_grid_shared(nphi=nphi,ntheta=nphi//2)
+    G, H, lmax = stack_planets(names,datDir=datDir)
+
+    key = field_key('Br_all',list(names),G,H,p2D[:,0],th2D[0,:],np.asarray(r,dtype=np.float64))
+    Br = disk_cache.get(key, lambda: 1e-3*getBplanets(G,H,lmax,r,p2D,th2D))
+
+    return p2D, th2D, Br
+
+def spec_table(names=planetlist,r=1,datDir=stdDatDir):
+
+    '''
+    Lowes spectra of several planets at one or several radii, padded with
+    zeros to the largest lmax: shape [nplanets, nr, lmax+1], without the
+    radius axis for a single r. Returns the spectra with the dipolarity
+    and dip_tot of every planet and radius, e.g. for comparative tables.
+    '''
+
+    specs = []
+
+    for name in names:
+        glm, hlm, lmax, idx = get_data(datDir,planet=name)
+        specs.append(get_spec(glm,hlm,idx,lmax,planet=name,r=r)[:2])
+
+    nl = max(E.shape[-1] for E, emag_10 in specs)
+    E = np.stack([np.pad(E,[(0,0)]*(E.ndim-1) + [(0,nl-E.shape[-1])]) for E, emag_10 in specs])
+    emag_10 = np.stack([emag_10 for E, emag_10 in specs])
+
+    dipolarity, dip_tot = get_dipolarity(E,emag_10)
+
+    return E, dipolarity, dip_tot
+
+def getBr_tiled(planet, r=1, nphi=8192, ntheta=4096, dtype=np.float64, maxmem=256*2**20,
+                nworkers=None, filename=None):
+
+    '''
+    Radial field (micro Tesla) at high resolution, computed in bands of
+    colatitude by a pool of threads with libgauss.getBtiled. The 2D grids
+    are not built: returns the 1D arrays phi and theta (the grid of
+    get_grid) and Br of shape [nphi, ntheta]. With a filename, Br is a
+    memory-mapped .npy file written band by band.
+    '''
+
+    import scipy.special as sp
+
+    phi = np.linspace(0.,2*np.pi,nphi)
+    theta = np.sort(np.arccos(sp.roots_legendre(ntheta)[0]))
+
+    if filename is not None:
+        out = np.lib.format.open_memmap(filename,mode='w+',dtype=dtype,shape=(nphi,ntheta))
+    else:
+        out = None
+
+    if planet.name in ["mercury", "saturn"]:
+        mmax = 0
+    else:
+        mmax = planet.lmax
+
+    Br = getBtiled(planet.lmax,1e-3*planet.glm,1e-3*planet.hlm,r,phi,theta,mmax=mmax,
+                   planet=planet.name,out=out,dtype=dtype,maxmem=maxmem,nworkers=nworkers)
+
+    if filename is not None:
+        Br.flush()
+
+    return phi, theta, Br
+
+def _init_worker(nphi,ntheta):
+
+    '''
+    Build the shared grid once per worker process
+    '''
+
+    get_grid_shared(nphi=nphi,ntheta=ntheta)
+
+def _init_render_worker(nphi,ntheta):
+
+    '''
+    Build the shared grid and draw off-screen in this worker process only
+    '''
+
+    plt.switch_backend('Agg')
+    get_grid_shared(nphi=nphi,ntheta=ntheta)
+
+def _compute_field(name,r,datDir,nphi):
+
+    from .planet import planet as Planet
+
+    planet = Planet(name=name,r=r,nphi=nphi,datDir=datDir,info=False)
+
+    return planet.Br, planet.dipTheta, planet.dipPhi
+
+def _render_panel(name,r,datDir,levels,cmap,proj,nphi=256):
+
+    '''
+    Draw the panel of one planet off-screen and return it as an RGBA image,
+    in a worker set up by _init_render_worker
+    '''
+
+    from .planet import planet as Planet
+
+    planet = Planet(name=name,r=r,nphi=nphi,datDir=datDir,info=False)
+
+    fig = plt.figure(figsize=(4,4))
+
+    if proj.lower() == 'hammer':
+        ax = plt.subplot(1,1,1)
+    else:
+        projection = get_projection(proj)
+        ax = plt.subplot(1,1,1,projection=projection)
+
+    plotB_subplot(planet.p2D,planet.th2D,planet.Br,ax,planet=name,
+                  levels=levels,cmap=cmap,proj=proj)
+
+    fig.canvas.draw()
+    img = np.asarray(fig.canvas.buffer_rgba()).copy()
+    plt.close(fig)
+
+    return img, planet.dipTheta, planet.dipPhi
+
+def compute_fields(names=planetlist,r=1.0,datDir=stdDatDir,nworkers=None,nphi=256):
+
+    '''
+    Compute the radial field of several planets in a pool of nworkers
+    processes (default: number of cores).
+
+    Returns a dictionary {name: (Br, dipTheta, dipPhi)}
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=nworkers,initializer=_init_worker,
+                             initargs=(nphi,nphi//2)) as pool:
+        futures = [pool.submit(_compute_field,name,r,datDir,nphi) for name in names]
+        results = [f.result() for f in futures]
+
+    return dict(zip(names,results))
+
+def plotAllFields(datDir=stdDatDir,r=1.0,levels=30,cmap='RdBu_r',proj='Mollweide',
+                  parallel=False,nworkers=None,render=False,nphi=256):
+
+    '''
+    Plot the radial field of all planets in planetlist in one figure.
+
+    With parallel=True the fields are computed in a pool of nworkers
+    processes (default: number of cores) and the figure is assembled here.
+    With render=True as well, the workers also draw their panel to an
+    image buffer, which is then shown as is. nphi sets the grid size.
+    '''
 
     from .planet import planet as Planet
 
@@ -51,36 +258,61 @@ def plotAllFields(datDir=stdDatDir,r=1.0,levels=30,cmap='RdBu_r',proj='Mollweide
     print(('|%-8s | %-2s| %-5s |' %('Planet','Theta','Phi')))
     print('|=========|======|=======|')
 
+    if parallel and render:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=nworkers,initializer=_init_render_worker,
+                                 initargs=(nphi,nphi//2)) as pool:
+            futures = [pool.submit(_render_panel,name,r,datDir,levels,cmap,proj,nphi)
+                       for name in planetlist]
+            panels = [f.result() for f in futures]
+    elif parallel:
+        fields = compute_fields(planetlist,r=r,datDir=datDir,nworkers=nworkers,nphi=nphi)
+        p2D, th2D = get_grid_shared(nphi=nphi,ntheta=nphi//2)
+    else:
+        p2D, th2D, Ball = synthBr_all(planetlist,r=r,datDir=datDir,nphi=nphi)
+
     plt.figure(figsize=(12,12))
 
     for k, name in enumerate(planetlist):
-        planet = Planet(name=name,r=r,info=False)
 
         if name == "ganymede":
             nplot = 8
         else:
             nplot = k+1
 
-        if proj.lower() == 'hammer':
+        if parallel and render:
+            img, dipTheta, dipPhi = panels[k]
             ax = plt.subplot(3,3,nplot)
+            ax.imshow(img)
+            ax.axis('off')
         else:
-            import cartopy.crs as ccrs
-            projection = eval('ccrs.'+proj+'()')
-            ax = plt.subplot(3,3,nplot,projection=projection)
-
-        plotB_subplot(planet.p2D,
-                      planet.th2D,
-                      planet.Br,
-                      ax,
-                      planet=name,
-                      levels=levels,
-                      cmap=cmap,
-                      proj=proj)
+            if parallel:
+                Br, dipTheta, dipPhi = fields[name]
+            else:
+                planet = Planet(name=name,r=r,datDir=datDir,info=False)
+                Br = Ball[k]
+                dipTheta, dipPhi = planet.dipTheta, planet.dipPhi
+
+            if proj.lower() == 'hammer':
+                ax = plt.subplot(3,3,nplot)
+            else:
+                projection = get_projection(proj)
+                ax = plt.subplot(3,3,nplot,projection=projection)
+
+            plotB_subplot(p2D,
+                          th2D,
+                          Br,
+                          ax,
+                          planet=name,
+                          levels=levels,
+                          cmap=cmap,
+                          proj=proj)
 
         if name in ["mercury","saturn"]:
-            print(('|%-8s | %-4.1f | %-5.1f |' %(name.capitalize(),planet.dipTheta, planet.dipPhi)))
+            print(('|%-8s | %-4.1f | %-5.1f |' %(name.capitalize(),dipTheta, dipPhi)))
         else:
-            print(('|%-8s | %-3.1f | %-5.1f |' %(name.capitalize(),planet.dipTheta, planet.dipPhi)))
+            print(('|%-8s | %-3.1f | %-5.1f |' %(name.capitalize(),dipTheta, dipPhi)))
 
     print('|---------|------|-------|')
 
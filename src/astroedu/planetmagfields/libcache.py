@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import threading
+import numpy as np
+from astroedu.lru import LRUCache
+
+
+# Grids and spherical harmonic basis tables shared by all planets and filters,
+# and the fields memoised by the planet class
+
+basis_cache = LRUCache()
+
+def set_cache_size(maxbytes):
+
+    '''
+    Set the maximum size in bytes of the shared basis cache,
+    0 disables caching
+    '''
+
+    basis_cache.resize(maxbytes)
+
+def cache_info():
+
+    return basis_cache.info()
+
+def clear_cache():
+
+    basis_cache.clear()
+
+def array_key(x):
+
+    '''
+    Hashable key for the content of a 1D grid array
+    '''
+
+    x = np.ascontiguousarray(x,dtype=np.float64)
+
+    return (x.size, hash(x.tobytes()))
+
+
+class diskcache:
+
+    '''
+    Cache of computed arrays stored as .npy files in a directory, shared by
+    all processes. Entries are found by a content hash (see field_key) and
+    read back memory-mapped in copy-on-write mode, so callers may modify
+    them without touching the file. The total size is capped at maxbytes:
+    files are evicted least recently used first, their modification time
+    being refreshed on every hit. New entries are written to a temporary
+    file and renamed, so concurrent writers never leave partial files.
+
+    The cache is off unless enabled with set_disk_cache() or with the
+    environment variable PLANETMAGFIELDS_DISK_CACHE=1. It lives in the
+    subdirectory fields/ of utils.get_cache_dir() unless path is given.
+    '''
+
+    def __init__(self,path=None,maxbytes=2**30,enabled=False):
+
+        self.path = path
+        self.maxbytes = maxbytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _dir(self):
+
+        if self.path is None:
+            from .utils import get_cache_dir
+            cacheDir = get_cache_dir()
+            if cacheDir is None:
+                return None
+            self.path = os.path.join(cacheDir,'fields')
+
+        try:
+            os.makedirs(self.path,exist_ok=True)
+        except OSError:
+            return None
+
+        return self.path
+
+    def get(self,key,func):
+
+        '''
+        Return the array stored under the hash key, computing it with
+        func() and storing it if it is not in the cache
+        '''
+
+        path = self._dir() if self.enabled else None
+
+        if path is None:
+            return func()
+
+        fname = os.path.join(path,key + '.npy')
+
+        try:
+            value = np.load(fname,mmap_mode='c')
+            os.utime(fname)
+            self.hits += 1
+            return value
+        except (OSError,ValueError):
+            pass
+
+        self.misses += 1
+        value = func()
+
+        try:
+            tmpfile = '%s.%d.%d.tmp' %(fname,os.getpid(),threading.get_ident())
+            with open(tmpfile,'wb') as f:
+                np.save(f,np.asarray(value))
+            os.replace(tmpfile,fname)
+            self._evict(path)
+        except OSError:
+            pass
+
+        return value
+
+    def _entries(self,path):
+
+        entries = []
+        for name in os.listdir(path):
+            if name.endswith('.npy'):
+                try:
+                    st = os.stat(os.path.join(path,name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime,st.st_size,name))
+
+        return sorted(entries)
+
+    def _evict(self,path):
+
+        entries = self._entries(path)
+        nbytes = sum(e[1] for e in entries)
+
+        for mtime, size, name in entries:
+            if nbytes <= self.maxbytes:
+                break
+            try:
+                os.remove(os.path.join(path,name))
+                self.evictions += 1
+            except OSError:
+                pass
+            nbytes -= size
+
+    def clear(self):
+
+        path = self._dir()
+        if path is not None:
+            for mtime, size, name in self._entries(path):
+                try:
+                    os.remove(os.path.join(path,name))
+                except OSError:
+                    pass
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def info(self):
+
+        path = self._dir() if self.enabled else None
+        entries = [] if path is None else self._entries(path)
+
+        return {'enabled': self.enabled,
+                'path': path,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(entries),
+                'nbytes': sum(e[1] for e in entries),
+                'maxbytes': self.maxbytes}
+
+
+# Field grids shared by all processes, opt-in
+
+disk_cache = diskcache(enabled=os.environ.get('PLANETMAGFIELDS_DISK_CACHE','0') not in ['','0'])
+
+def set_disk_cache(enabled=True,maxbytes=None,path=None):
+
+    '''
+    Turn the on-disk field cache on or off, optionally setting its size
+    cap in bytes and its directory
+    '''
+
+    disk_cache.enabled = enabled
+    if maxbytes is not None:
+        disk_cache.maxbytes = maxbytes
+    if path is not None:
+        disk_cache.path = path
+
+def field_key(*parts):
+
+    '''
+    Hash identifying a computed field from its inputs (arrays, numbers,
+    strings), the same in every process
+    '''
+
+    h = hashlib.sha1()
+
+    for part in parts:
+        if isinstance(part,np.ndarray):
+            part = np.ascontiguousarray(part)
+            h.update(('%s%s' %(part.dtype.str,part.shape)).encode())
+            h.update(part.tobytes())
+        else:
+            h.update(repr(part).encode())
+        h.update(b'|')
+
+    return h.hexdigest()
@@ -3,8 +3,8 @@
 
 import numpy as np
 import scipy.special as sp
-from copy import deepcopy
 from importlib_resources import files
+from .libcache import basis_cache, array_key
 
 def gen_idx(lmax):
 
@@ -23,28 +23,52 @@ def gen_idx(lmax):
 
     return np.int32(idx)
 
-def get_data(datDir,planet="earth"):
+# Epochs of the main field models in IGRF13.dat, the last column is the
+# secular variation (nT/yr) valid after the last epoch
 
-    datfile = datDir.joinpath(planet+'.dat')
+igrf_epochs = np.arange(1900.,2021.,5.)
 
-    if planet == "earth":
-        datfile = datDir.joinpath('IGRF13.dat')
-        dat = np.loadtxt(datfile,usecols=[1,2,-2])
-        gh  = np.genfromtxt(datfile,usecols=[0],dtype='str')
+def read_igrf(datDir):
 
-        mask = gh == 'g'
-        gDat = dat[mask,:]
-        g   = gDat[:,-1]
-        gl  = gDat[:,0]
+    '''
+    All epochs of the IGRF model. Returns the epochs, the Gauss coefficients
+    glm, hlm of shape [nepochs, nlm], their secular variation glm_sv,
+    hlm_sv [nlm] after the last epoch, lmax and idx
+    '''
 
-        mask = gh == 'h'
-        hDat = dat[mask,:]
-        h   = hDat[:,-1]
-        hm  = hDat[:,1]
-        hIdx = np.where(hm == 1.)[0]
-        h   = np.insert(h,hIdx,0.)
+    datfile = datDir.joinpath('IGRF13.dat')
+    dat = np.loadtxt(datfile,usecols=range(1,len(igrf_epochs)+4))
+    gh  = np.genfromtxt(datfile,usecols=[0],dtype='str')
 
-        lmax = np.int32(gl.max())
+    l = np.int32(dat[:,0])
+    m = np.int32(dat[:,1])
+
+    lmax = l.max()
+    idx = gen_idx(lmax)
+
+    G = np.zeros([idx[lmax,lmax]+1,len(igrf_epochs)+1])
+    H = np.zeros_like(G)
+
+    mask = gh == 'g'
+    G[idx[l[mask],m[mask]]] = dat[mask,2:]
+
+    mask = gh == 'h'
+    H[idx[l[mask],m[mask]]] = dat[mask,2:]
+
+    return igrf_epochs, G[:,:-1].T, H[:,:-1].T, G[:,-1], H[:,-1], lmax, idx
+
+def read_data(datDir,planet="earth"):
+
+    '''
+    Parse the Gauss coefficients of a planet from its .dat text file
+    '''
+
+    datfile = datDir.joinpath(planet+'.dat')
+
+    if planet == "earth":
+        epochs, glm, hlm, glm_sv, hlm_sv, lmax, idx = read_igrf(datDir)
+
+        return glm[-1], hlm[-1], lmax, idx
 
     elif planet in ["mercury","saturn"]:
         dat = np.loadtxt(datfile,usecols=[3])
@@ -106,22 +130,183 @@ def get_data(datDir,planet="earth"):
 
     return g,h,lmax,idx
 
-def get_grid(nphi=256,ntheta=128):
+def datfile_name(planet):
+
+    if planet == "earth":
+        return 'IGRF13.dat'
+    else:
+        return planet+'.dat'
+
+# In-process copy of the coefficient store of each data file
+
+_stores = {}
+
+def get_store(datDir,kind="earth"):
+
+    '''
+    Preparsed coefficients of one data file in datDir, stored as a .npz in
+    the planetmagfields cache directory. kind is a planet name, or 'igrf'
+    for all the epochs of IGRF13.dat. The store is rebuilt whenever the
+    SHA-1 hash of the .dat file differs from the one it was built from.
+    Returns None if no store can be written.
+    '''
+
+    import hashlib
+    import os
+    from .utils import get_cache_dir
+
+    datfile = datDir.joinpath(datfile_name('earth' if kind == 'igrf' else kind))
+    digest = hashlib.sha1(datfile.read_bytes()).hexdigest()
+
+    key = (str(datfile),kind)
+    if key in _stores and _stores[key]['hash'] == digest:
+        return _stores[key]
+
+    cacheDir = get_cache_dir()
+    if cacheDir is None:
+        return None
+
+    storefile = os.path.join(cacheDir,'coeffs_%s_%s.npz'
+                             %(hashlib.sha1(str(datfile).encode()).hexdigest()[:16],kind))
+
+    store = None
+    try:
+        with np.load(storefile) as f:
+            if str(f['hash']) == digest:
+                store = dict(f)
+    except (OSError,ValueError,KeyError):
+        pass
+
+    if store is None:
+        store = {'hash': digest}
+        if kind == 'igrf':
+            for k, v in zip(['epochs','glm','hlm','glm_sv','hlm_sv','lmax'], read_igrf(datDir)):
+                store[k] = v
+        else:
+            store['glm'], store['hlm'], store['lmax'], store['idx'] = read_data(datDir,planet=kind)
+
+        try:
+            tmpfile = storefile + '.%d.tmp.npz' %os.getpid()
+            np.savez(tmpfile,**store)
+            os.replace(tmpfile,storefile)
+        except OSError:
+            pass
+
+    store['hash'] = str(store['hash'])
+    _stores[key] = store
+
+    return store
+
+def get_data(datDir,planet="earth"):
+
+    '''
+    Gauss coefficients glm, hlm, lmax and idx of a planet, from the
+    preparsed coefficient store when available
+    '''
+
+    try:
+        store = get_store(datDir,planet)
+    except OSError:
+        store = None
+
+    if store is None:
+        return read_data(datDir,planet=planet)
 
-    phi    = np.linspace(0.,2*np.pi,nphi)
+    return (store['glm'].copy(), store['hlm'].copy(),
+            np.int32(store['lmax']), store['idx'].copy())
+
+def get_igrf(datDir):
+
+    '''
+    read_igrf from the preparsed coefficient store when available
+    '''
+
+    try:
+        store = get_store(datDir,'igrf')
+    except OSError:
+        store = None
+
+    if store is None:
+        return read_igrf(datDir)
+
+    lmax = np.int32(store['lmax'])
+
+    return (store['epochs'].copy(), store['glm'].copy(), store['hlm'].copy(),
+            store['glm_sv'].copy(), store['hlm_sv'].copy(), lmax, gen_idx(lmax))
+
+def nyquist_grid(lmax,pad=2.,closed=True):
+
+    '''
+    Grid size (nphi, ntheta) resolving degree lmax, with ntheta = pad*(lmax+1)
+    Gauss-Legendre colatitudes and twice as many distinct longitudes.
+    pad=1 is the smallest grid on which anaB and sht are exact.
+    '''
+
+    ntheta = int(np.ceil(pad*(lmax+1)))
+    nphi = 2*ntheta
+
+    if closed:
+        nphi += 1
+
+    return nphi, ntheta
+
+def get_grid(nphi=256,ntheta=128,lmax=None,pad=2.,closed=True):
+
+    '''
+    Regular grid in longitude and Gauss-Legendre grid in colatitude,
+    p2D and th2D of shape [nphi, ntheta]. With lmax, the size follows from
+    nyquist_grid(lmax,pad) instead of nphi, ntheta. With closed=True (the
+    default) the longitudes go from 0 to 2pi inclusive, so the last
+    column repeats the first one and plots wrap around; closed=False
+    keeps only the distinct longitudes.
+    '''
+
+    if lmax is not None:
+        nphi, ntheta = nyquist_grid(lmax,pad=pad,closed=closed)
+
+    phi    = np.linspace(0.,2*np.pi,nphi,endpoint=closed)
     x,w    = sp.roots_legendre(ntheta)
     theta  = np.sort(np.arccos(x))
 
-    p2D  = np.zeros([nphi, ntheta])
-    th2D = np.zeros([nphi, ntheta])
+    p2D, th2D = np.meshgrid(phi,theta,indexing='ij')
 
-    for i in range(nphi):
-        p2D[i,:] = phi[i]
+    return p2D, th2D
 
-    for j in range(ntheta):
-        th2D[:,j] = theta[j]
+def get_grid_shared(nphi=256,ntheta=128,closed=True):
 
-    return p2D, th2D
+    '''
+    get_grid through the shared basis cache, the arrays are read-only
+    '''
+
+    return basis_cache.get(('grid',nphi,ntheta,closed),
+                           lambda: get_grid(nphi=nphi,ntheta=ntheta,closed=closed))
+
+def get_grid_reduced(nphi=256,ntheta=128,lmax=None,pad=2.,nphi_min=8):
+
+    '''
+    Reduced grid with fewer longitudes towards the poles: on the ring at
+    colatitude theta there are max(nphi_min, nphi sin(theta)) longitudes,
+    so that all cells have about the same area. With lmax the size follows
+    from nyquist_grid(lmax,pad). Returns the colatitudes of the rings,
+    the number of points of every ring and the flat arrays phi, theta of
+    all points, ring after ring.
+    '''
+
+    if lmax is not None:
+        nphi, ntheta = nyquist_grid(lmax,pad=pad,closed=False)
+
+    x,w    = sp.roots_legendre(ntheta)
+    theta  = np.sort(np.arccos(x))
+
+    nring = np.maximum(nphi_min,np.round(nphi*np.sin(theta))).astype(int)
+
+    ring  = np.repeat(np.arange(ntheta),nring)
+    start = np.concatenate([[0],np.cumsum(nring)[:-1]])
+    k     = np.arange(len(ring)) - start[ring]
+
+    phi_pts = 2*np.pi * k / nring[ring]
+
+    return theta, nring, phi_pts, theta[ring]
 
 def gen_arr(lmax, l1,m1,mode='g'):
 
@@ -169,139 +354,738 @@ def gen_arr(lmax, l1,m1,mode='g'):
 
     return glm, hlm, lArr, mArr, idx
 
+def gen_lm(lmax,mmax=None):
+
+    '''
+    Degree and order arrays of all (l,m) with m <= min(l,mmax),
+    in the same order as gen_idx
+    '''
+
+    if mmax is None:
+        mmax = lmax
+
+    l, m = np.tril_indices(lmax+1)
+    mask = m <= mmax
+
+    return l[mask], m[mask]
+
+def get_plm(lmax,theta,mmax=None,divsin=False):
+
+    '''
+    Schmidt semi-normalized associated Legendre functions P_lm(cos(theta))
+    without the Condon-Shortley phase, computed with the standard stable
+    recurrence in l for every order m. Returns an array of shape
+    [nlm, *theta.shape], ordered as gen_lm(lmax,mmax)
+
+    With divsin=True, returns P_lm/sin(theta) for m > 0 (and 0 for m = 0),
+    which stays finite at the poles
+    '''
+
+    if mmax is None:
+        mmax = lmax
+
+    theta = np.asarray(theta,dtype=np.float64)
+    x = np.cos(theta)
+    s = np.sin(theta)
+
+    l, m = gen_lm(lmax,mmax)
+    lm2idx = np.zeros([lmax+1,mmax+1],dtype=np.int64)
+    lm2idx[l,m] = np.arange(len(l))
+
+    plm = np.zeros((len(l),) + theta.shape)
+
+    if divsin:
+        pmm = np.zeros_like(x)
+    else:
+        pmm = np.ones_like(x)
+
+    for mm in range(mmax+1):
+        if mm == 1:
+            pmm = np.ones_like(x) if divsin else s
+        elif mm > 1:
+            pmm = np.sqrt((2*mm-1)/(2*mm)) * s * pmm
+
+        plm[lm2idx[mm,mm]] = pmm
+
+        if mm < lmax:
+            plm[lm2idx[mm+1,mm]] = np.sqrt(2*mm+1) * x * pmm
+
+        for ell in range(mm+2,lmax+1):
+            plm[lm2idx[ell,mm]] = ( (2*ell-1) * x * plm[lm2idx[ell-1,mm]]
+                                  - np.sqrt((ell-1)**2 - mm**2) * plm[lm2idx[ell-2,mm]] ) \
+                                  / np.sqrt(ell**2 - mm**2)
+
+    return plm
+
+def get_dplm(lmax,theta,mmax=None):
+
+    '''
+    theta derivative of the Schmidt semi-normalized P_lm, from the relation
+    with orders m-1 and m+1 which stays finite at the poles. Same shape and
+    ordering as get_plm(lmax,theta,mmax)
+    '''
+
+    if mmax is None:
+        mmax = lmax
+
+    theta = np.asarray(theta,dtype=np.float64)
+
+    mmax1 = min(mmax+1,lmax)
+
+    return dplm_from_plm(lmax,mmax,get_plm(lmax,theta,mmax=mmax1))
+
+def dplm_from_plm(lmax,mmax,plm1):
+
+    '''
+    get_dplm from P_lm already computed up to order min(mmax+1,lmax)
+    '''
+
+    mmax1 = min(mmax+1,lmax)
+    l1, m1 = gen_lm(lmax,mmax1)
+
+    P2 = np.zeros((lmax+1,mmax+2) + plm1.shape[1:])
+    P2[l1,m1] = plm1
+
+    l, m = gen_lm(lmax,mmax)
+    l = np.float64(l)
+
+    cdown = np.where(m == 1, np.sqrt(l*(l+1)/2), 0.5*np.sqrt((l+m)*(l-m+1)))
+    cdown[m == 0] = 0.
+    cup   = np.where(m == 0, np.sqrt(l*(l+1)/2), 0.5*np.sqrt((l-m)*(l+m+1)))
+
+    ext = (slice(None),) + (None,)*(plm1.ndim-1)
+
+    dplm = cdown[ext] * P2[np.int64(l),np.maximum(m-1,0)] - cup[ext] * P2[np.int64(l),m+1]
+
+    return dplm
+
+def get_fourier(mmax,phi):
+
+    '''
+    cos(m phi) and sin(m phi) for 0 <= m <= mmax, shape [nphi, mmax+1]
+    '''
+
+    mphi = np.outer(phi,np.arange(mmax+1))
+
+    return np.cos(mphi), np.sin(mphi)
+
+def get_basis(kind,lmax,x,mmax=None):
+
+    '''
+    Basis table on a 1D grid x, shared through libcache.basis_cache:
+
+        'plm'     : get_plm(lmax,x,mmax)
+        'dplm'    : get_dplm(lmax,x,mmax)
+        'plm_s'   : get_plm(lmax,x,mmax,divsin=True)
+        'fourier' : get_fourier(mmax,x), x being longitudes
+        'wts'     : get_wts(x)
+
+    Tables are read-only.
+    '''
+
+    if mmax is None:
+        mmax = lmax
+
+    if kind == 'plm':
+        func = lambda: get_plm(lmax,x,mmax=mmax)
+    elif kind == 'dplm':
+        func = lambda: get_dplm(lmax,x,mmax=mmax)
+    elif kind == 'plm_s':
+        func = lambda: get_plm(lmax,x,mmax=mmax,divsin=True)
+    elif kind == 'fourier':
+        lmax = None
+        func = lambda: get_fourier(mmax,x)
+    elif kind == 'wts':
+        lmax = mmax = None
+        func = lambda: get_wts(x)
+    else:
+        raise ValueError("Unknown basis table: %s" %kind)
+
+    return basis_cache.get((kind,lmax,mmax) + array_key(x), func)
+
+def get_csphase(m,planet="earth"):
+
+    '''
+    Sign applied to order m: the Gauss coefficients of Earth include
+    the Condon-Shortley phase, the other planets do not
+    '''
+
+    if planet in ["earth"]:
+        return (-1.)**m
+    else:
+        return np.ones_like(m,dtype=np.float64)
+
+def synth_grid(alm,blm,m,plm,cosmp,sinmp):
+
+    '''
+    Separable synthesis on a (phi,theta) grid:
+
+        sum_lm [ alm cos(m phi) + blm sin(m phi) ] P_lm(theta)
+
+    The Legendre sum is done for every order as a matrix product, giving
+    the Fourier amplitudes per colatitude, followed by a matrix product
+    with the Fourier basis. alm and blm may carry leading batch
+    dimensions [..., nlm], the result has shape [..., nphi, ntheta].
+    '''
+
+    Am, Bm = legendre_sum(alm,blm,m,plm,cosmp.shape[1]-1)
+
+    return cosmp @ Am + sinmp @ Bm
+
+def legendre_sum(alm,blm,m,plm,mmax):
+
+    '''
+    Fourier amplitudes per colatitude, Am = sum_l alm P_lm and the same
+    for blm, of shape [..., mmax+1, ntheta]
+    '''
+
+    alm = np.asarray(alm)
+    blm = np.asarray(blm)
+
+    shape = alm.shape[:-1] + (mmax+1, plm.shape[-1])
+    Am = np.zeros(shape)
+    Bm = np.zeros(shape)
+
+    for mm in range(mmax+1):
+        mask = m == mm
+        Am[...,mm,:] = alm[...,mask] @ plm[mask]
+        Bm[...,mm,:] = blm[...,mask] @ plm[mask]
+
+    return Am, Bm
+
 def getB(lmax,glm,hlm,idx,r,p2D,th2D,planet="earth"):
 
-    Br = np.zeros_like(p2D)
+    '''
+    Radial field on the grid (p2D, th2D). The separable synthesis needs a
+    tensor-product grid, as given by get_grid, with phi constant along
+    the second axis and theta along the first. Other grids (e.g. rotated
+    ones) are evaluated point by point with getBpoints.
+    '''
 
-    for l in range(1,lmax+1):
-        for m in range(l+1):
-            ylm = sp.sph_harm(m, l, p2D, th2D)
+    p2D = np.asarray(p2D)
+    th2D = np.asarray(th2D)
 
-            # Include Condon-Shortley Phase for Earth but not other planets
-            # Scipy sph_harm has the phase included by default
+    l, m = gen_lm(lmax)
 
-            if planet in ["earth"]:
-                fac_m = 1.
-            else:
-                fac_m = (-1)**m
+    if not (p2D.ndim == 2 and p2D.shape == th2D.shape
+            and np.array_equal(p2D,np.broadcast_to(p2D[:,:1],p2D.shape))
+            and np.array_equal(th2D,np.broadcast_to(th2D[:1,:],th2D.shape))):
+        glm = np.asarray(glm)
+        if glm.ndim > 1:
+            raise ValueError("Stacks of coefficients need a tensor-product grid (see get_grid)")
+        return getBpoints(lmax,glm[idx[l,m]],np.asarray(hlm)[idx[l,m]],r,th2D,p2D,planet=planet)[0]
 
-            if m != 0:
-                fac_m *= np.sqrt(2)
+    phi   = p2D[:,0]
+    theta = th2D[0,:]
 
-            fac = fac_m * (l+1) * r**(-l-2) * np.sqrt((4.*np.pi)/(2*l+1))
+    fac = (l+1) * r**(-l-2.) * get_csphase(m,planet=planet)
+    fac[l == 0] = 0.
 
-            G = glm[idx[l,m]] * np.real(ylm)
-            H = hlm[idx[l,m]] * np.imag(ylm)
+    plm = get_basis('plm',lmax,theta)
+    cosmp, sinmp = get_basis('fourier',lmax,phi)
 
-            Br +=   np.real(fac * (G + H))
+    Br = synth_grid(fac * glm[...,idx[l,m]], fac * hlm[...,idx[l,m]], m, plm, cosmp, sinmp)
 
     return Br
 
+def getBtiled(lmax,glm,hlm,r,phi,theta,mmax=None,planet="earth",out=None,
+              dtype=np.float64,maxmem=256*2**20,nworkers=None):
+
+    '''
+    Radial field on the grid of the 1D arrays phi and theta, computed in
+    bands of colatitude by a pool of nworkers threads (NumPy releases the
+    GIL in the matrix products). glm and hlm are ordered as
+    gen_lm(lmax,mmax). The band width is chosen so that the temporaries
+    of all threads stay below maxmem bytes, and every band is written
+    into out, a preallocated array of shape [nphi, ntheta], e.g. a
+    np.memmap, allocated here if None. dtype=np.float32 halves the
+    memory of the output and of the temporaries.
+    '''
+
+    from concurrent.futures import ThreadPoolExecutor
+    import os
+
+    if mmax is None:
+        mmax = lmax
+    if nworkers is None:
+        nworkers = os.cpu_count()
+
+    nphi, ntheta = len(phi), len(theta)
+
+    if out is None:
+        out = np.empty((nphi,ntheta),dtype=dtype)
+
+    l, m = gen_lm(lmax,mmax)
+
+    fac = (l+1) * r**(-l-2.) * get_csphase(m,planet=planet)
+    fac[l == 0] = 0.
+    alm = fac * glm[:len(l)]
+    blm = fac * hlm[:len(l)]
+
+    plm = get_basis('plm',lmax,theta,mmax=mmax)
+    cosmp, sinmp = get_basis('fourier',lmax,phi,mmax=mmax)
+    cosmp = cosmp.astype(dtype)
+    sinmp = sinmp.astype(dtype)
+
+    # Two [nphi, band] temporaries per thread
+
+    itemsize = np.dtype(dtype).itemsize
+    band = int(maxmem // (2 * nworkers * nphi * itemsize))
+    band = min(max(band,1),ntheta)
+
+    def work(j):
+        sl = slice(j,min(j+band,ntheta))
+        Am, Bm = legendre_sum(alm,blm,m,plm[:,sl],mmax)
+        tmp = cosmp @ Am.astype(dtype)
+        tmp += sinmp @ Bm.astype(dtype)
+        out[:,sl] = tmp
+
+    with ThreadPoolExecutor(max_workers=nworkers) as pool:
+        list(pool.map(work,range(0,ntheta,band)))
+
+    return out
+
+def getBrings(lmax,glm,hlm,r,theta,nring,phi,mmax=None,planet="earth"):
+
+    '''
+    Radial field on the reduced grid of get_grid_reduced: theta and nring
+    describe the rings and phi holds the longitudes of all points, ring
+    after ring. glm and hlm are ordered as gen_lm(lmax,mmax). The Legendre
+    sums are done once per ring and the Fourier sum once per point.
+    '''
+
+    if mmax is None:
+        mmax = lmax
+
+    l, m = gen_lm(lmax,mmax)
+
+    fac = (l+1) * r**(-l-2.) * get_csphase(m,planet=planet)
+    fac[l == 0] = 0.
+
+    plm = get_basis('plm',lmax,theta,mmax=mmax)
+    Am, Bm = legendre_sum(fac * glm[:len(l)], fac * hlm[:len(l)], m, plm, mmax)
+
+    ring = np.repeat(np.arange(len(theta)),nring)
+    cosmp, sinmp = get_fourier(mmax,phi)
+
+    return np.einsum('ij,ji->i',cosmp,Am[:,ring]) + np.einsum('ij,ji->i',sinmp,Bm[:,ring])
+
+def pad_coeffs(glm,hlm,lmax,idx,lmax_pad,planet="earth"):
+
+    '''
+    Gauss coefficients of a planet in the order gen_lm(lmax_pad), zero for
+    the degrees it does not have, with the Condon-Shortley sign of the
+    planet applied so that all planets share one convention. Mercury and
+    Saturn are axisymmetric, their coefficients are indexed by degree.
+    '''
+
+    L, M = gen_lm(lmax_pad)
+    g = np.zeros(len(L))
+    h = np.zeros(len(L))
+
+    if planet in ['mercury','saturn']:
+        keep = (M == 0) & (L <= lmax)
+        g[keep] = glm[L[keep]]
+        h[keep] = hlm[L[keep]]
+    else:
+        keep = L <= lmax
+        g[keep] = glm[idx[L[keep],M[keep]]]
+        h[keep] = hlm[idx[L[keep],M[keep]]]
+
+    sign = get_csphase(M,planet=planet)
+
+    return sign*g, sign*h
+
+def getBplanets(G,H,lmax,r,p2D,th2D):
+
+    '''
+    Radial field of several planets on one grid from their coefficients
+    padded to a common lmax with pad_coeffs, G and H of shape
+    [nplanets, nlm]. r is a single radius or one per planet. All planets
+    go through the same synthesis, giving [nplanets, nphi, ntheta].
+    '''
+
+    phi   = p2D[:,0]
+    theta = th2D[0,:]
+
+    l, m = gen_lm(lmax)
+    r = np.asarray(r,dtype=np.float64)[...,None]
+
+    fac = np.where(l == 0, 0., (l+1) * r**(-l-2.))
+
+    plm = get_basis('plm',lmax,theta)
+    cosmp, sinmp = get_basis('fourier',lmax,phi)
+
+    return synth_grid(fac * G, fac * H, m, plm, cosmp, sinmp)
+
+def getBdeg(lmax,glm,hlm,p2D,th2D,mmax=None,planet="earth",vector=False):
+
+    '''
+    Angular maps of every spherical harmonic degree,
+
+        Yl = sum_m (glm cos(m phi) + hlm sin(m phi)) P_lm(theta)
+
+    shape [lmax+1, nphi, ntheta]. glm and hlm are ordered as
+    gen_lm(lmax,mmax). Since r only enters as the factor r**(-l-2),
+    the field at any radius follows from these with getBstack. With
+    vector=True, the maps of dYl/dtheta and dYl/dphi / sin(theta) are
+    returned as well.
+    '''
+
+    if mmax is None:
+        mmax = lmax
+
+    phi   = p2D[:,0]
+    theta = th2D[0,:]
+
+    l, m = gen_lm(lmax,mmax)
+    sign = get_csphase(m,planet=planet)
+
+    # One set of coefficients per degree
+
+    ldeg = np.arange(lmax+1)[:,None] == l[None,:]
+    g = np.where(ldeg, sign * glm[:len(l)], 0.)
+    h = np.where(ldeg, sign * hlm[:len(l)], 0.)
+
+    cosmp, sinmp = get_basis('fourier',lmax,phi,mmax=mmax)
+
+    Yl = synth_grid(g,h,m,get_basis('plm',lmax,theta,mmax=mmax),cosmp,sinmp)
+
+    if not vector:
+        return Yl
+
+    dYl = synth_grid(g,h,m,get_basis('dplm',lmax,theta,mmax=mmax),cosmp,sinmp)
+    pYl = synth_grid(m*h,-m*g,m,get_basis('plm_s',lmax,theta,mmax=mmax),cosmp,sinmp)
+
+    return Yl, dYl, pYl
+
+def getBstack(lmaps,radii):
+
+    '''
+    Field at several radii from the degree maps of getBdeg, as one
+    [nr, lmax+1] x [lmax+1, nphi*ntheta] product. Returns Br of shape
+    [nr, nphi, ntheta], or (Br, Btheta, Bphi) if lmaps holds the three
+    sets of maps of getBdeg(...,vector=True).
+    '''
+
+    radii = np.atleast_1d(np.asarray(radii,dtype=np.float64))
+
+    vector = isinstance(lmaps,tuple)
+    Yl = lmaps[0] if vector else lmaps
+
+    nl = Yl.shape[0]
+    shape = (len(radii),) + Yl.shape[1:]
+    ell = np.arange(nl)
+
+    rfac = radii[:,None]**(-ell-2.)
+
+    Br = (((ell+1) * rfac) @ Yl.reshape(nl,-1)).reshape(shape)
+
+    if not vector:
+        return Br
+
+    Bt = -(rfac @ lmaps[1].reshape(nl,-1)).reshape(shape)
+    Bp = -(rfac @ lmaps[2].reshape(nl,-1)).reshape(shape)
+
+    return Br, Bt, Bp
+
+def getBfilt(lmax,glm,hlm,weights,r,p2D,th2D,mmax=None,planet="earth"):
+
+    '''
+    Radial field at radius r with the contribution of every coefficient
+    multiplied by weights[..., nlm], glm and hlm being ordered as
+    gen_lm(lmax,mmax). A stack of weights, or of coefficient sets, gives
+    one map per row, [..., nphi, ntheta], from the cached Legendre and
+    Fourier tables.
+    '''
+
+    if mmax is None:
+        mmax = lmax
+
+    phi   = p2D[:,0]
+    theta = th2D[0,:]
+
+    l, m = gen_lm(lmax,mmax)
+
+    fac = (l+1) * r**(-l-2.) * get_csphase(m,planet=planet)
+    fac[l == 0] = 0.
+
+    plm = get_basis('plm',lmax,theta,mmax=mmax)
+    cosmp, sinmp = get_basis('fourier',lmax,phi,mmax=mmax)
+
+    w = np.asarray(weights) * fac
+
+    return synth_grid(w * glm[...,:len(l)], w * hlm[...,:len(l)], m, plm, cosmp, sinmp)
+
+def sample_coeffs(glm,hlm,K,sigma_g=None,sigma_h=None,cov=None,seed=None):
+
+    '''
+    K random sets of Gauss coefficients around glm, hlm, with independent
+    Gaussian errors of standard deviations sigma_g, sigma_h or with the
+    covariance cov of the stacked vector [glm, hlm]. Returns G, H of
+    shape [K, nlm].
+    '''
+
+    rng = np.random.default_rng(seed)
+    n = len(glm)
+
+    if cov is not None:
+        dev = rng.multivariate_normal(np.zeros(2*n),cov,size=K,method='eigh')
+    else:
+        sigma = np.concatenate([np.broadcast_to(0. if sigma_g is None else sigma_g,n),
+                                np.broadcast_to(0. if sigma_h is None else sigma_h,n)])
+        dev = rng.standard_normal((K,2*n)) * sigma
+
+    return glm + dev[:,:n], hlm + dev[:,n:]
+
+def getBensemble(lmax,G,H,glm,hlm,r,p2D,th2D,mmax=None,planet="earth",chunk=128):
+
+    '''
+    Mean and standard deviation of the radial fields of an ensemble of
+    coefficient sets G, H [K, nlm] (e.g. from sample_coeffs), ordered as
+    gen_lm(lmax,mmax). Every chunk of samples is synthesised in one
+    batched pass; since the field is linear in the coefficients, the
+    deviations from the field of glm, hlm are accumulated, which keeps
+    the variance accurate when it is small compared to the field.
+    '''
+
+    nl = len(gen_lm(lmax,mmax)[0])
+    G = np.asarray(G)[:,:nl] - glm[:nl]
+    H = np.asarray(H)[:,:nl] - hlm[:nl]
+    K = len(G)
+
+    B0 = getBfilt(lmax,glm,hlm,1.,r,p2D,th2D,mmax=mmax,planet=planet)
+
+    S1 = np.zeros_like(B0)
+    S2 = np.zeros_like(B0)
+
+    for i in range(0,K,chunk):
+        D = getBfilt(lmax,G[i:i+chunk],H[i:i+chunk],1.,r,p2D,th2D,mmax=mmax,planet=planet)
+        S1 += D.sum(axis=0)
+        S2 += (D**2).sum(axis=0)
+
+    dmean = S1/K
+    var = (S2 - K*dmean**2)/max(K-1,1)
+
+    return B0 + dmean, np.sqrt(np.maximum(var,0.))
+
+def getBlinear(lmax,glm,hlm,r,p2D,th2D,sigma_g=None,sigma_h=None,cov=None,mmax=None,planet="earth"):
+
+    '''
+    Radial field and its standard deviation from linear propagation of
+    the errors of the coefficients: independent errors sigma_g, sigma_h
+    or the covariance cov of the stacked vector [glm, hlm]. Uses the map
+    of every coefficient, A [2 nlm, nphi, ntheta], and var = diag(A^T cov A).
+    '''
+
+    if mmax is None:
+        mmax = lmax
+
+    n = len(gen_lm(lmax,mmax)[0])
+    eye = np.eye(n)
+    zero = np.zeros((n,n))
+
+    A = np.concatenate([getBfilt(lmax,eye,zero,1.,r,p2D,th2D,mmax=mmax,planet=planet),
+                        getBfilt(lmax,zero,eye,1.,r,p2D,th2D,mmax=mmax,planet=planet)])
+    A = A.reshape(2*n,-1)
+
+    B = np.concatenate([glm[:n],hlm[:n]]) @ A
+
+    if cov is not None:
+        cov = np.asarray(cov)
+        if cov.shape != (2*n,2*n):
+            raise ValueError("cov must have shape (2 nlm, 2 nlm) = (%d, %d)" %(2*n,2*n))
+        var = np.einsum('ij,ij->j',A,cov @ A)
+    else:
+        sigma = np.concatenate([np.broadcast_to(0. if sigma_g is None else sigma_g,len(glm))[:n],
+                                np.broadcast_to(0. if sigma_h is None else sigma_h,len(hlm))[:n]])
+        var = (sigma**2) @ A**2
+
+    shape = p2D.shape
+
+    return B.reshape(shape), np.sqrt(var).reshape(shape)
+
+def getBpoints(lmax,glm,hlm,r,theta,phi,mmax=None,planet="earth",chunk=8192):
+
+    '''
+    Radial, colatitudinal and azimuthal field at arbitrary points
+    (r,theta,phi), r in units of the surface radius. glm and hlm are
+    ordered as gen_lm(lmax,mmax), i.e. as returned by get_data. The points
+    are processed in chunks of at most chunk points so the harmonic basis
+    never exceeds nlm x chunk values.
+    '''
+
+    r, theta, phi = np.broadcast_arrays(np.float64(r),np.float64(theta),np.float64(phi))
+    shape = r.shape
+    r, theta, phi = r.ravel(), theta.ravel(), phi.ravel()
+
+    if mmax is None:
+        mmax = lmax
+
+    l, m = gen_lm(lmax,mmax)
+    sign = get_csphase(m,planet=planet)
+    g = (sign * glm[:len(l)])[:,None]
+    h = (sign * hlm[:len(l)])[:,None]
+    ell = np.arange(lmax+1)[:,None]
+
+    mmax1 = min(mmax+1,lmax)
+    l1, m1 = gen_lm(lmax,mmax1)
+    mask = m1 <= mmax
+
+    Br = np.zeros(r.size)
+    Bt = np.zeros(r.size)
+    Bp = np.zeros(r.size)
+
+    for i in range(0,r.size,chunk):
+        sl = slice(i,i+chunk)
+
+        plm1 = get_plm(lmax,theta[sl],mmax=mmax1)
+        dplm = dplm_from_plm(lmax,mmax,plm1)
+
+        # P_lm/sin(theta) from the same table, the divsin recurrence only
+        # being needed at the poles
+
+        sint = np.sin(theta[sl])
+        pole = sint < 1e-8
+        plm_s = plm1[mask] / np.where(pole,1.,sint)
+        plm_s[m == 0] = 0.
+        if pole.any():
+            plm_s[:,pole] = get_plm(lmax,theta[sl][pole],mmax=mmax,divsin=True)
+
+        rfac = (r[sl]**(-ell-2.))[l]
+        cosmp, sinmp = get_fourier(mmax,phi[sl])
+        cosmp = cosmp.T[m]
+        sinmp = sinmp.T[m]
+
+        G = rfac * (g * cosmp + h * sinmp)
+        H = rfac * (g * sinmp - h * cosmp)
+
+        Br[sl] =  np.einsum('i,ij,ij->j',l+1.,G,plm1[mask])
+        Bt[sl] = -np.einsum('ij,ij->j',G,dplm)
+        Bp[sl] =  np.einsum('i,ij,ij->j',np.float64(m),H,plm_s)
+
+    return Br.reshape(shape), Bt.reshape(shape), Bp.reshape(shape)
+
 def getBm0(lmax,g,r,p2D,th2D):
 
-    Br = np.zeros_like(p2D)
+    theta = th2D[0,:]
 
-    for l in range(1,lmax+1):
-        ylm = sp.sph_harm(0, l, p2D, th2D)
-        fac = (l + 1) * r**(-l-2) * np.sqrt((4.*np.pi)/(2*l+1))
+    l = np.arange(lmax+1)
+    fac = (l+1) * r**(-l-2.)
+    fac[0] = 0.
 
-        Br += fac * g[l] * np.real(ylm)
+    plm = get_basis('plm',lmax,theta,mmax=0)
+
+    Br = np.zeros_like(p2D)
+    Br[:] = (fac * g[l]) @ plm
 
     return Br
 
 def get_spec(glm,hlm,idx,lmax,planet='earth',r=1):
-    E = np.zeros(lmax+1)
+
+    '''
+    Lowes spectrum E(l) = (l+1) r^(-2l-4) sum_m (glm^2 + hlm^2) and the
+    energy of the axial dipole, emag_10. glm and hlm may carry leading
+    dimensions, e.g. one set of coefficients per epoch, and r may be an
+    array of radii: E has shape glm.shape[:-1] + np.shape(r) + (lmax+1,)
+    and emag_10 the same shape without the last axis.
+    '''
 
     if planet in ['mercury','saturn']:
-        for l in range(1,lmax+1):
-            E[l] = (l+1) * r**(-2*l-4) *(np.abs(glm[l])**2 + np.abs(hlm[l])**2)
-        emag_10 = E[1]
+        l = np.arange(lmax+1)
+        pos = l
+        pos10 = 1
     else:
-        for l in range(1,lmax+1):
-            for m in range(l+1):
-                E[l] += (l+1) * r**(-2*l-4) *(np.abs(glm[idx[l,m]])**2 + np.abs(hlm[idx[l,m]])**2)
+        l, m = gen_lm(lmax)
+        pos = idx[l,m]
+        pos10 = idx[1,0]
+
+    glm = np.asarray(glm)
+    hlm = np.asarray(hlm)
+    r = np.asarray(r,dtype=np.float64)
+    ell = np.arange(lmax+1)
+
+    # Sum over orders as a product with the degree of every coefficient
+
+    El = (np.abs(glm[...,pos])**2 + np.abs(hlm[...,pos])**2) @ (l[:,None] == ell[None,:])
+    El[...,0] = 0.
+
+    shape = El.shape[:-1] + (1,)*r.ndim
+
+    E = (ell+1) * r[...,None]**(-2*ell-4.) * El.reshape(shape + (lmax+1,))
+    emag_10 = 2 * r**(-6.) * np.abs(glm[...,pos10]).reshape(shape)**2
 
-        emag_10 = 2 * r**(-2*l-4)* np.abs(glm[idx[1,0]])**2
     return E, emag_10
 
-def filt_Gauss(glm,hlm,lmax,idx,larr=None,marr=None,lCutMin=0,lCutMax=None,mmin=0,mmax=None):
+def get_dipolarity(E,emag_10):
+
+    '''
+    Dipolarity (axial dipole energy over total) and dip_tot (dipole
+    energy over total) from the output of get_spec
+    '''
+
+    Etot = E.sum(axis=-1)
 
-    glm_filt = deepcopy(glm)
-    hlm_filt = deepcopy(hlm)
+    return emag_10/Etot, E[...,1]/Etot
+
+def filt_weights(lmax,larr=None,marr=None,lCutMin=0,lCutMax=None,mmin=0,mmax=None):
+
+    '''
+    Weights (1 kept, 0 removed) of every degree and every order for a
+    filter given either by arrays of the degrees/orders to keep or by the
+    bands lCutMin <= l <= lCutMax, mmin <= m <= mmax. Returns wl and wm,
+    each of length lmax+1: the coefficient (l,m) is weighted by wl[l]*wm[m].
+    '''
 
     if lCutMax is None:
         lCutMax = lmax
     if mmax is None:
         mmax = lmax
 
+    ell = np.arange(lmax+1)
+    wl = np.ones(lmax+1)
+    wm = np.ones(lmax+1)
+
     if larr is not None:
         if max(larr) > lmax:
             print("Error! Values in filter array must be <= lmax=%d" %lmax)
         else:
-            for ell in range(lmax+1):
-                if ell not in larr:
-                    glm_filt[idx[ell,:]] = 0.
-                    hlm_filt[idx[ell,:]] = 0.
+            wl[~np.isin(ell,larr)] = 0.
     else:
         if lCutMax > lmax or lCutMin > lmax:
             print("Error! lCutMin/lCutMax must be <= lmax = %d" %lmax)
         else:
-            for ell in range(lCutMin):
-                    glm_filt[idx[ell,:]] = 0.
-                    hlm_filt[idx[ell,:]] = 0.
-            for ell in range(lCutMax,lmax+1):
-                    glm_filt[idx[ell,:]] = 0.
-                    hlm_filt[idx[ell,:]] = 0.
+            wl[(ell < lCutMin) | (ell > lCutMax)] = 0.
 
     if marr is not None:
         if max(marr) > lmax:
             print("Error! Values in filter array must be <= lmax=%d" %lmax)
         else:
-            for m in range(lmax+1):
-                if m not in marr:
-                    glm_filt[idx[:,m]] = 0.
-                    hlm_filt[idx[:,m]] = 0.
+            wm[~np.isin(ell,marr)] = 0.
     else:
         if mmin > lmax or mmax > lmax:
             print("Error! mmin/mmax must be <= lmax = %d" %lmax)
         else:
-            for m in range(mmin):
-                    glm_filt[idx[:,m]] = 0.
-                    hlm_filt[idx[:,m]] = 0.
-            for m in range(mmax+1,lmax+1):
-                    glm_filt[idx[:,m]] = 0.
-                    hlm_filt[idx[:,m]] = 0.
+            wm[(ell < mmin) | (ell > mmax)] = 0.
 
-    return glm_filt,hlm_filt
+    return wl, wm
 
-def filt_Gaussm0(glm,hlm,lmax,larr=None,lCutMin=0,lCutMax=None):
+def filt_Gauss(glm,hlm,lmax,idx,larr=None,marr=None,lCutMin=0,lCutMax=None,mmin=0,mmax=None):
 
-    glm_filt = deepcopy(glm)
-    hlm_filt = deepcopy(hlm)
+    wl, wm = filt_weights(lmax,larr=larr,marr=marr,lCutMin=lCutMin,lCutMax=lCutMax,
+                          mmin=mmin,mmax=mmax)
 
-    if lCutMax is None:
-        lCutMax = lmax
+    l, m = gen_lm(lmax)
+    w = np.ones(len(glm))
+    w[idx[l,m]] = wl[l] * wm[m]
 
-    if larr is not None:
-        if max(larr) > lmax:
-            print("Error! Values in filter array must be <= lmax=%d" %lmax)
-        else:
-            for ell in range(lmax+1):
-                if ell not in larr:
-                    glm_filt[ell] = 0.
-                    hlm_filt[ell] = 0.
-    else:
-        if lCutMax > lmax or lCutMin > lmax:
-            print("Error! lCutMin/lCutMax must be <= lmax = %d" %lmax)
-        else:
-            for ell in range(lCutMin):
-                    glm_filt[ell] = 0.
-                    hlm_filt[ell] = 0.
-            for ell in range(lCutMax,lmax+1):
-                    glm_filt[ell] = 0.
-                    hlm_filt[ell] = 0.
+    return glm*w, hlm*w
+
+def filt_Gaussm0(glm,hlm,lmax,larr=None,lCutMin=0,lCutMax=None):
+
+    wl, wm = filt_weights(lmax,larr=larr,lCutMin=lCutMin,lCutMax=lCutMax)
 
-    return glm_filt,hlm_filt
+    return glm*wl, hlm*wl
 
 
 def sphInt(f,g,phi,th2D,theta):
@@ -312,38 +1096,89 @@ def sphInt(f,g,phi,th2D,theta):
     return phiInt
 
 
-def getGauss(lmax,Br,r,phi,theta,th2D,p2D):
+def get_wts(theta):
 
     '''
-    Get Gauss coefficients from a surface field
+    Gauss-Legendre quadrature weights for the colatitudes of get_grid
     '''
-    glm = []
-    hlm = []
 
-    comp = complex(0,1)
+    x, w = sp.roots_legendre(len(theta))
 
-    for l in range(0,lmax+1):
-        for m in range(0,l+1):
+    return w[np.argsort(np.arccos(x))]
 
-            ylm = (-1)**m * sp.sph_harm(m, l, p2D, th2D)
+def get_mfft(phi):
 
-            ylm_conj = np.conjugate(ylm)
+    '''
+    Number of distinct longitudes of a regular phi grid: the grid of
+    get_grid repeats phi=0 at phi=2pi
+    '''
+
+    nphi = len(phi)
+
+    if nphi > 1 and np.isclose(phi[-1]-phi[0],2*np.pi):
+        nphi -= 1
+
+    return nphi
+
+def anaB(lmax,Br,r,phi,theta,planet="earth"):
+
+    '''
+    Schmidt semi-normalized Gauss coefficients of a radial field given on
+    the grid of get_grid, the inverse of getB. The field is Fourier
+    transformed in phi and projected on P_lm with the Gauss-Legendre
+    weights, so all coefficients are obtained in one pass. Br may be a
+    stack of maps [..., nphi, ntheta], for example several epochs or radii,
+    with r a scalar or an array of the leading shape. Returns glm, hlm of
+    shape [..., nlm] in the [idx] ordering of gen_idx.
+    '''
+
+    Br = np.asarray(Br,dtype=np.float64)
+    r  = np.asarray(r,dtype=np.float64)[...,None]
+
+    nfft = get_mfft(phi)
+
+    if nfft <= 2*lmax or len(theta) <= lmax:
+        nphi_min, ntheta_min = nyquist_grid(lmax,pad=1,closed=nfft < len(phi))
+        raise ValueError("Grid too small for lmax=%d: got nphi=%d, ntheta=%d, need nphi >= %d "
+                         "and ntheta >= %d" %(lmax,len(phi),len(theta),nphi_min,ntheta_min))
+    fm = np.fft.rfft(Br[...,:nfft,:],axis=-2)[...,:lmax+1,:] / nfft
 
-            fac = r**(l+2)/(l+1)
+    l, m = gen_lm(lmax)
 
-            if m==0:
-                fac *= 0.5
+    wplm = get_basis('plm',lmax,theta) * get_basis('wts',lmax,theta)
 
-            I1 = sphInt(Br,ylm,phi,th2D,theta)
-            I2 = sphInt(Br,ylm_conj,phi,th2D,theta)
+    # The Schmidt P_lm integrate to 2/(2l+1) for m=0 and 4/(2l+1) for m>0,
+    # the extra factor 2 of m>0 cancels the one of the real Fourier series
+
+    fac = r**(l+2.)/((l+1) * get_csphase(m,planet=planet)) * (2*l+1)/2.
+
+    proj = np.zeros(fm.shape[:-2] + (len(l),),dtype=np.complex128)
+
+    for mm in range(lmax+1):
+        mask = m == mm
+        proj[...,mask] = fm[...,mm,:] @ wplm[mask].T
+
+    glm =  fac * proj.real
+    hlm = -fac * proj.imag
+
+    return glm, hlm
+
+def getGauss(lmax,Br,r,phi,theta,th2D,p2D):
+
+    '''
+    Get Gauss coefficients from a surface field
+
+    Coefficients are for orthonormal harmonics without Condon-Shortley
+    phase. Use anaB for Schmidt semi-normalized coefficients.
+    '''
 
-            g = fac * (I2 + I1)
-            h = comp * fac * (I2 - I1)
+    glm, hlm = anaB(lmax,Br,r,phi,theta,planet=None)
 
-            glm.append(g)
-            hlm.append(h)
+    l, m = gen_lm(lmax)
+    fac = np.sqrt(4*np.pi/(2*l+1))
+    fac[m > 0] *= np.sqrt(2.)
 
-    glm = np.array(glm)
-    hlm = np.array(hlm)
+    glm = np.complex128(fac * glm)
+    hlm = np.complex128(fac * hlm)
 
-    return glm, hlm
\ No newline at end of file
+    return glm, hlm
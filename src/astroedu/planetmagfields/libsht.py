@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import scipy.special as sp
+from .libgauss import gen_lm, get_basis
+
+
+class sht:
+
+    '''
+    Spherical harmonic transforms on a Gauss-Legendre grid, written with
+    NumPy only. The interface follows the one of SHTns:
+
+        sh = sht(lmax,mmax=mmax)
+        ntheta, nphi = sh.set_grid(ntheta,nphi)
+        qlm = sh.analys(f)            # f[ntheta,nphi] -> qlm[nlm]
+        f = sh.synth(qlm)             # scalar synthesis
+        vt, vp = sh.synth(slm,tlm)    # spheroidal/toroidal synthesis
+
+    Harmonics are orthonormal without the Condon-Shortley phase and the
+    complex coefficients are stored for m >= 0 in the order of SHTns
+    (m-major), see sh.l, sh.m and sh.idx(l,m). The transforms use a real
+    FFT along phi and tabulated Legendre functions with the Gauss weights
+    along theta. All arrays may carry leading batch dimensions, e.g. one
+    spatial map or one set of coefficients per radius.
+    '''
+
+    def __init__(self,lmax,mmax=None):
+
+        if mmax is None:
+            mmax = lmax
+
+        self.lmax = lmax
+        self.mmax = mmax
+
+        self.m = np.concatenate([np.full(lmax+1-m,m) for m in range(mmax+1)])
+        self.l = np.concatenate([np.arange(m,lmax+1) for m in range(mmax+1)])
+        self.nlm = len(self.l)
+
+        self._mstart = np.concatenate([[0],np.cumsum(lmax+1-np.arange(mmax+1))])
+
+    def idx(self,l,m):
+
+        return self._mstart[m] + l - m
+
+    def set_grid(self,nlat,nphi,closed=True):
+
+        '''
+        Gauss-Legendre grid in theta and a regular grid in phi. With
+        closed=True the phi grid is that of libgauss.get_grid, going from
+        0 to 2pi with the last longitude repeating the first one.
+        '''
+
+        self.closed = closed
+        self.nlat = nlat
+        self.nphi = nphi
+
+        nfft = nphi - 1 if closed else nphi
+
+        if nlat <= self.lmax or nfft <= 2*self.mmax:
+            raise ValueError("Grid too small for lmax=%d, mmax=%d: got nlat=%d, nphi=%d, need "
+                             "nlat > %d and nphi > %d" %(self.lmax,self.mmax,nlat,nphi,
+                                                         self.lmax,2*self.mmax + (nphi - nfft)))
+
+        self._nfft = nfft
+
+        x, w = sp.roots_legendre(nlat)
+        order = np.argsort(np.arccos(x))
+        self.theta = np.arccos(x)[order]
+        self.wts = w[order]
+        self.phi = np.linspace(0.,2*np.pi,nphi,endpoint=closed)
+
+        # Orthonormal normalization from Schmidt semi-normalized functions
+
+        lg, mg = gen_lm(self.lmax,self.mmax)
+        perm = np.argsort(mg*(self.lmax+1) + lg,kind='stable')
+
+        norm = np.sqrt((2*self.l+1)/(4*np.pi))
+        norm[self.m > 0] /= np.sqrt(2.)
+
+        self.ylm  = norm[:,None] * get_basis('plm',self.lmax,self.theta,mmax=self.mmax)[perm]
+        self.dylm = norm[:,None] * get_basis('dplm',self.lmax,self.theta,mmax=self.mmax)[perm]
+        self.wylm = self.ylm * self.wts * 2*np.pi/nfft
+
+        return nlat, nphi
+
+    def _to_spat(self,fm):
+
+        '''
+        Fourier coefficients [...,nlat,mmax+1] to the spatial grid
+        '''
+
+        nfft = self._nfft
+        fk = np.zeros(fm.shape[:-1] + (nfft//2+1,),dtype=np.complex128)
+        fk[...,:self.mmax+1] = fm * nfft
+        f = np.fft.irfft(fk,n=nfft,axis=-1)
+
+        if self.closed:
+            f = np.concatenate([f,f[...,:1]],axis=-1)
+
+        return f
+
+    def _legendre_synth(self,qlm,table):
+
+        qlm = np.asarray(qlm)
+        fm = np.zeros(qlm.shape[:-1] + (self.nlat,self.mmax+1),dtype=np.complex128)
+
+        for m in range(self.mmax+1):
+            sl = slice(self._mstart[m],self._mstart[m+1])
+            fm[...,m] = qlm[...,sl] @ table[sl]
+
+        return fm
+
+    def analys(self,f):
+
+        '''
+        Spatial field [...,nlat,nphi] to coefficients [...,nlm]
+        '''
+
+        f = np.asarray(f,dtype=np.float64)
+
+        if self.closed:
+            f = f[...,:-1]
+
+        fm = np.fft.rfft(f,axis=-1)[...,:self.mmax+1]
+
+        qlm = np.zeros(f.shape[:-2] + (self.nlm,),dtype=np.complex128)
+
+        for m in range(self.mmax+1):
+            sl = slice(self._mstart[m],self._mstart[m+1])
+            qlm[...,sl] = fm[...,m] @ self.wylm[sl].T
+
+        return qlm
+
+    def synth(self,qlm,tlm=None):
+
+        '''
+        With one argument, scalar synthesis of qlm [...,nlm] to [...,nlat,nphi].
+        With two, synthesis of the theta and phi components of the vector
+        field with spheroidal potential qlm and toroidal potential tlm:
+
+            vt = dS/dtheta + 1/sin(theta) dT/dphi
+            vp = 1/sin(theta) dS/dphi - dT/dtheta
+        '''
+
+        if tlm is None:
+            return self._to_spat(self._legendre_synth(qlm,self.ylm))
+
+        im = 1j * self.m
+        sint = np.sin(self.theta)[:,None]
+
+        ds  = self._legendre_synth(qlm,self.dylm)
+        dt  = self._legendre_synth(tlm,self.dylm)
+        ims = self._legendre_synth(im*qlm,self.ylm) / sint
+        imt = self._legendre_synth(im*tlm,self.ylm) / sint
+
+        vt = self._to_spat(ds + imt)
+        vp = self._to_spat(ims - dt)
+
+        return vt, vp
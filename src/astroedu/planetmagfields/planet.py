@@ -3,19 +3,26 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from .libgauss import get_data, filt_Gauss, filt_Gaussm0,getB, getBm0, get_spec
-from .libbfield import getBr
+from .libgauss import get_data, gen_lm, filt_weights, getBpoints, getBdeg, getBstack, getBfilt, getBensemble, getBlinear, sample_coeffs, get_spec, get_dipolarity, get_grid_shared, nyquist_grid
+from .libbfield import synthBr, get_dipole, print_info
+from .libcache import basis_cache, disk_cache, field_key
 from .plotlib import plotSurf, plot_spec
 from .utils import stdDatDir, planetlist
 
 
 class planet:
 
+    '''
+    Magnetic field of a planet. Only the Gauss coefficients are loaded on
+    construction: the grid, the dipole angles and the radial field Br at
+    radius self.r are computed when first accessed, and the fields of every
+    radius and grid used are memoised on the instance. nphi='auto' picks
+    the grid size from lmax (libgauss.nyquist_grid).
+    '''
+
     def __init__(self,name='earth',r=1,nphi=256,datDir=stdDatDir,info=True):
 
         self.name   = name.lower()
-        self.nphi   = nphi
-        self.ntheta = nphi//2
 
         if self.name not in planetlist:
             print("Planet must be one of the following!")
@@ -25,26 +32,71 @@ class planet:
         self.glm, self.hlm, self.lmax, self.idx = \
                 get_data(self.datDir,planet=self.name)
 
-        self.p2D, self.th2D, self.Br, self.dipTheta, self.dipPhi = \
-                getBr(self,r=r,
-                    nphi=self.nphi,
-                    ntheta=self.ntheta,
-                    info=info)
+        if nphi == 'auto':
+            nphi = nyquist_grid(self.lmax)[0]
+
+        self.nphi   = nphi
+        self.ntheta = nphi//2
 
-        self.phi = self.p2D[:,0]
-        self.theta = self.th2D[0,:]
         self.r = r
 
+        if info:
+            print_info(self,self.dipTheta)
+
+    @property
+    def p2D(self):
+        return get_grid_shared(nphi=self.nphi,ntheta=self.ntheta)[0]
+
+    @property
+    def th2D(self):
+        return get_grid_shared(nphi=self.nphi,ntheta=self.ntheta)[1]
+
+    @property
+    def phi(self):
+        return self.p2D[:,0]
+
+    @property
+    def theta(self):
+        return self.th2D[0,:]
+
+    @property
+    def dipTheta(self):
+        return get_dipole(self)[0]
+
+    @property
+    def dipPhi(self):
+        return get_dipole(self)[1]
+
+    def _memo_key(self):
+
+        '''
+        Grid and coefficients a memoised field was computed with, so that
+        changing either one does not return stale fields
+        '''
+
+        return (self.name,self.nphi,self.ntheta,hash(self.glm.tobytes() + self.hlm.tobytes()))
+
+    @property
+    def Br(self):
+        return self.Br_at(self.r)
+
+    def Br_at(self,r):
+
+        '''
+        Radial magnetic field (micro Tesla) at radius r on the planet's grid,
+        memoised per radius and grid in the bounded libcache.basis_cache.
+        Returns a writable copy.
+        '''
+
+        key = ('Br',float(r)) + self._memo_key()
+
+        return basis_cache.get(key, lambda: synthBr(self,r,self.p2D,self.th2D)).copy()
+
     def plot(self,r=1,levels=30,cmap='RdBu_r',proj='Mollweide'):
         plt.figure(figsize=(12,6.75))
 
-        if r == 1:
-            ax,cbar = plotSurf(self.p2D,self.th2D,self.Br,levels=levels,cmap=cmap,proj=proj)
-        else:
-            self.p2D, self.th2D, self.Br, self.dipTheta, self.dipPhi = \
-                    getBr(planet=self,r=r,info=False)
-            self.r = r
-            ax,cbar = plotSurf(self.p2D,self.th2D,self.Br,levels=levels,cmap=cmap,proj=proj)
+        self.r = r
+        ax,cbar = plotSurf(self.p2D,self.th2D,self.Br,levels=levels,cmap=cmap,proj=proj)
 
         cbar.ax.set_xlabel(r'Radial magnetic field ($\mu$T)',fontsize=25)
         cbar.ax.tick_params(labelsize=20)
@@ -65,21 +117,175 @@ class planet:
         ax.set_title(self.name.capitalize() + radLabel,fontsize=25,pad=20)
         plt.tight_layout()
 
-    def writeVtsFile(self,potExtra=False,ratio_out=2,nrout=32):
-            from .potextra import extrapot, writeVts
+    def _mmax(self):
+
+        if self.name in ['mercury','saturn']:
+            return 0
+        else:
+            return self.lmax
+
+    def _lmaps(self,vector=False):
+
+        '''
+        Angular maps of every degree (getBdeg), memoised per grid in the
+        bounded libcache.basis_cache (read-only)
+        '''
+
+        key = ('lmaps',vector) + self._memo_key()
+
+        return basis_cache.get(key, lambda: getBdeg(self.lmax,self.glm,self.hlm,self.p2D,self.th2D,
+                                                    mmax=self._mmax(),planet=self.name,vector=vector))
+
+    def Br_stack(self,radii,vector=False):
+
+        '''
+        Radial magnetic field (micro Tesla) on the planet's grid at several
+        radii, shape [nr, nphi, ntheta]. The angular map of every degree is
+        computed once per planet and each radius only rescales them.
+        With vector=True, returns (Br, Btheta, Bphi).
+        '''
+
+        B = getBstack(self._lmaps(vector),radii)
+
+        if vector:
+            return tuple(1e-3*b for b in B)
+        else:
+            return 1e-3*B
+
+    def Br_uncertainty(self,r=1,sigma_g=None,sigma_h=None,cov=None,K=None,samples=None,seed=None):
+
+        '''
+        Mean and standard deviation (micro Tesla) of the radial field at
+        radius r given errors of the Gauss coefficients: independent
+        standard deviations sigma_g, sigma_h (same shape as glm, hlm) or
+        the covariance cov of the stacked vector [glm, hlm].
+
+        By default the errors are propagated linearly, which is exact
+        since the field is linear in the coefficients. With K, the
+        result is a Monte Carlo estimate from K samples; samples=(G, H)
+        [K, nlm] uses a given ensemble instead.
+        '''
+
+        kw = {'mmax': self._mmax(), 'planet': self.name}
+
+        if samples is None and K is None:
+            Bm, Bs = getBlinear(self.lmax,self.glm,self.hlm,r,self.p2D,self.th2D,
+                                sigma_g=sigma_g,sigma_h=sigma_h,cov=cov,**kw)
+        else:
+            if samples is None:
+                samples = sample_coeffs(self.glm,self.hlm,K,sigma_g=sigma_g,sigma_h=sigma_h,
+                                        cov=cov,seed=seed)
+            G, H = samples
+            Bm, Bs = getBensemble(self.lmax,G,H,self.glm,self.hlm,r,self.p2D,self.th2D,**kw)
+
+        return 1e-3*Bm, 1e-3*Bs
+
+    def field_at(self,r,theta,phi,chunk=8192):
+
+        '''
+        Magnetic field (Br, Btheta, Bphi) in micro Tesla at points given by
+        radius (in terms of the surface radius), colatitude and longitude
+        (radians). Inputs are broadcast together, e.g. arrays of N points
+        along a trajectory, and processed chunk points at a time.
+        '''
+
+        Br, Bt, Bp = getBpoints(self.lmax,self.glm,self.hlm,r,theta,phi,
+                                mmax=self._mmax(),planet=self.name,chunk=chunk)
+
+        return 1e-3*Br, 1e-3*Bt, 1e-3*Bp
+
+    def writeVtsFile(self,potExtra=False,ratio_out=2,nrout=32,chunk=16,store='vts'):
+
+            '''
+            Write the field between the surface and ratio_out surface radii
+            for 3D visualisation, chunk radii at a time, either to the VTK
+            file <name>.vts (store='vts') or to a directory of compressed
+            chunks <name>/ (store='npz', see potextra.writeChunked). An
+            interrupted export resumes when called again.
+            '''
+
+            from .potextra import extrapot, streamVts, writeChunked
 
             rout = np.linspace(1,ratio_out,nrout)
+
             if potExtra:
-                brout, btout, bpout = extrapot(self.lmax,1.,self.Br,rout)
+                def field(rc):
+                    return extrapot(self.lmax,1.,self.Br,rc)
             else:
-                brout = self.Br
-                btout = np.zeros_like(self.Br)
-                bpout = np.zeros_like(self.Br)
-
-            writeVts(self.name,brout,btout,bpout,rout,self.theta,self.phi)
+                # Field directly from the Gauss coefficients at every radius
+                def field(rc):
+                    return [np.transpose(b,(1,2,0)) for b in self.Br_stack(rc,vector=True)]
+
+            if store == 'vts':
+                streamVts(self.name,field,rout,self.theta,self.phi,chunk=chunk)
+            elif store == 'npz':
+                writeChunked(self.name,field,rout,self.theta,self.phi,chunk=chunk)
+            else:
+                print("Error! store must be 'vts' or 'npz'")
 
     ## Filtered plots
 
+    def Br_weighted(self,weights,r=1):
+
+        '''
+        Radial magnetic field (micro Tesla) at radius r with the contribution
+        of every coefficient multiplied by weights[..., nlm], ordered as
+        self.glm. A stack of weights gives a stack of maps.
+        '''
+
+        return 1e-3*getBfilt(self.lmax,self.glm,self.hlm,weights,r,self.p2D,self.th2D,
+                             mmax=self._mmax(),planet=self.name)
+
+    def Br_degrees(self,r=1):
+
+        '''
+        Contribution of every degree l to the radial field (micro Tesla) at
+        radius r, shape [lmax+1, nphi, ntheta]. Rescales the memoised
+        degree maps, so no harmonics are evaluated again.
+        '''
+
+        ell = np.arange(self.lmax+1)
+        rfac = (ell+1) * r**(-ell-2.)
+
+        return 1e-3 * rfac[:,None,None] * self._lmaps()
+
+    def Br_orders(self,r=1):
+
+        '''
+        Contribution of every order m to the radial field (micro Tesla) at
+        radius r, shape [mmax+1, nphi, ntheta]
+        '''
+
+        l, m = gen_lm(self.lmax,self._mmax())
+
+        return self.Br_weighted(np.arange(self._mmax()+1)[:,None] == m[None,:],r=r)
+
+    def Br_filtered(self,r=1,larr=None,marr=None,lCutMin=0,lCutMax=None,mmin=0,mmax=None):
+
+        '''
+        Radial magnetic field (micro Tesla) at radius r keeping only the
+        degrees and orders selected as in libgauss.filt_weights. A filter
+        on degrees alone is a weighted sum of the memoised degree maps,
+        any other filter reweights the coefficients of one synthesis.
+        '''
+
+        wl, wm = filt_weights(self.lmax,larr=larr,marr=marr,lCutMin=lCutMin,
+                              lCutMax=lCutMax,mmin=mmin,mmax=mmax)
+
+        key = field_key('Br_filt',self.name,self.glm,self.hlm,self.phi,self.theta,float(r),wl,wm)
+
+        return disk_cache.get(key, lambda: self._Br_filtered(r,wl,wm))
+
+    def _Br_filtered(self,r,wl,wm):
+
+        if np.all(wm[:self._mmax()+1] == 1.):
+            ell = np.arange(self.lmax+1)
+            return 1e-3 * np.tensordot(wl * (ell+1) * r**(-ell-2.),self._lmaps(),axes=1)
+
+        l, m = gen_lm(self.lmax,self._mmax())
+
+        return self.Br_weighted(wl[l] * wm[m],r=r)
+
     def plot_filt(self,r=1,larr=None,marr=None,lCutMin=0,lCutMax=None,mmin=0,mmax=None,levels=30,cmap='RdBu_r',proj='Mollweide'):
 
         self.larr_filt = larr
@@ -96,17 +302,14 @@ class planet:
 
         self.r_filt = r
 
-        if self.name in ['mercury','saturn']:
-            self.glm_filt,self.hlm_filt =\
-                    filt_Gaussm0(self.glm,self.hlm,self.lmax,larr=self.larr_filt,\
-                        lCutMin=self.lCutMin,lCutMax=self.lCutMax)
-            self.Br_filt = 1e-3*getBm0(self.lmax,self.glm_filt,self.r_filt,self.p2D,self.th2D)
-        else:
-            self.glm_filt,self.hlm_filt =\
-                filt_Gauss(self.glm,self.hlm,self.lmax,self.idx,larr=self.larr_filt,\
-                    marr=self.marr_filt,lCutMin=self.lCutMin,lCutMax=self.lCutMax,mmin=self.mmin_filt,mmax=self.mmax_filt)
+        wl, wm = filt_weights(self.lmax,larr=larr,marr=marr,lCutMin=lCutMin,
+                              lCutMax=lCutMax,mmin=mmin,mmax=mmax)
+        l, m = gen_lm(self.lmax,self._mmax())
+        self.glm_filt = self.glm * (wl[l] * wm[m])
+        self.hlm_filt = self.hlm * (wl[l] * wm[m])
 
-            self.Br_filt = 1e-3*getB(self.lmax,self.glm_filt,self.hlm_filt,self.idx,self.r_filt,self.p2D,self.th2D,planet=self.name)
+        self.Br_filt = self.Br_filtered(r=r,larr=larr,marr=marr,lCutMin=lCutMin,
+                                        lCutMax=lCutMax,mmin=mmin,mmax=mmax)
 
         plt.figure(figsize=(12,6.75))
 
@@ -117,8 +320,10 @@ class planet:
         else:
             radLabel = r'  $r/r_{\rm surface}=%.2f$' %r
 
+        elllabel = ''
+
         if self.larr_filt is not None:
-            elllabel = r', $l = %s$' %np.str(self.larr_filt)
+            elllabel = r', $l = %s$' %str(self.larr_filt)
         else:
             if self.lCutMin > 0:
                 if self.lCutMax < self.lmax:
@@ -130,7 +335,7 @@ class planet:
                 elllabel = r', $l \leq %d$' %self.lCutMax
 
         if self.marr_filt is not None:
-            elllabel += r', $m = %s$' %np.str(self.marr_filt)
+            elllabel += r', $m = %s$' %str(self.marr_filt)
         else:
             if self.mmin_filt > 0:
                 if self.mmax_filt < self.lmax:
@@ -150,13 +355,21 @@ class planet:
 
 
     def spec(self,r=1,iplot=True):
+
+        '''
+        Lowes spectrum at radius r, stored in self.emag_spec along with
+        the dipolarity and dip_tot. r may be an array of radii, giving
+        emag_spec of shape [nr, lmax+1] and arrays of dipolarity and dip_tot.
+        The plot is only drawn for a single radius.
+        '''
+
         self.emag_spec, emag_10 = get_spec(self.glm,self.hlm,self.idx,self.lmax,planet=self.name,r=r)
         l = np.arange(self.lmax+1)
 
-        self.dip_tot = self.emag_spec[1]/sum(self.emag_spec)
-        self.dipolarity = emag_10/sum(self.emag_spec)
-        if iplot:
+        self.dipolarity, self.dip_tot = get_dipolarity(self.emag_spec,emag_10)
+
+        if iplot and np.ndim(r) == 0:
             plt.figure(figsize=(7,7))
             plot_spec(l,self.emag_spec,r,self.name)
             plt.tight_layout()
-            plt.show()
\ No newline at end of file
+            plt.show()
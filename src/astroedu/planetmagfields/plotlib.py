@@ -4,6 +4,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
+from astroedu.lru import LRUCache
+from .libcache import array_key
 
 def hammer2cart(ttheta, pphi, colat=False):
     """
@@ -24,7 +26,80 @@ def hammer2cart(ttheta, pphi, colat=False):
              /np.sqrt(1.+np.sin(ttheta)*np.sin(pphi/2.))
     return xx, yy
 
-def plotSurf(p2D,th2D,B,levels=60,cmap='RdBu_r',proj='Mollweide'):
+# Projected coordinates of the grids, shared by all planets, radii and frames
+
+proj_cache = LRUCache(maxbytes=64*2**20)
+_projections = {}
+
+def get_projection(proj):
+
+    '''
+    cartopy projection for the name proj, created once
+    '''
+
+    import cartopy.crs as ccrs
+
+    if proj not in _projections:
+        _projections[proj] = eval('ccrs.'+proj+'()')
+
+    return _projections[proj]
+
+def proj_coords(p2D,th2D,proj='hammer'):
+
+    '''
+    Coordinates of the grid p2D, th2D (longitude from 0 to 2pi and
+    colatitude) to pass to contourf for the map projection proj, cached
+    per projection and grid. Returns xx, yy and the cartopy transform
+    of these coordinates: the Hammer projection of the grid with None,
+    or longitude and latitude in degrees with PlateCarree for cartopy
+    projections. The inputs are not modified.
+    '''
+
+    hammer = proj.lower() == 'hammer'
+
+    def func():
+        lon2D = p2D - np.pi
+        lat2D = np.pi/2 - th2D
+
+        if hammer:
+            return hammer2cart(lat2D,lon2D)
+
+        return lon2D*180/np.pi, lat2D*180/np.pi
+
+    key = ('hammer' if hammer else 'lonlat',) + p2D.shape + array_key(p2D[:,0]) + array_key(th2D[0,:])
+    xx, yy = proj_cache.get(key,func)
+
+    if hammer:
+        transform = None
+    else:
+        transform = get_projection('PlateCarree')
+
+    return xx, yy, transform
+
+def proj_edges(p2D,th2D,proj='hammer'):
+
+    '''
+    Projected corners of the cells around the points of the grid p2D,
+    th2D, shape [nphi+1, ntheta+1], for pcolormesh. Like proj_coords,
+    returns xx, yy and their cartopy transform, all cached.
+    '''
+
+    def mid(x,lo,hi):
+        return np.concatenate([[lo],(x[1:]+x[:-1])/2,[hi]])
+
+    phi = mid(p2D[:,0],0.,2*np.pi)
+    theta = mid(th2D[0,:],0.,np.pi)
+
+    pe2D, the2D = np.meshgrid(phi,theta,indexing='ij')
+
+    return proj_coords(pe2D,the2D,proj=proj)
+
+def get_bmax(B):
+
+    '''
+    Colour scale limit: max |B| rounded to an integer, or to one
+    decimal below 10
+    '''
 
     bmax = np.abs(B).max()
     digits = int(np.log10(bmax)) + 1
@@ -34,30 +109,32 @@ def plotSurf(p2D,th2D,B,levels=60,cmap='RdBu_r',proj='Mollweide'):
     else:
         bmax = np.round(bmax,decimals=1)
 
+    return bmax
+
+def plotSurf(p2D,th2D,B,levels=60,cmap='RdBu_r',proj='Mollweide'):
+
+    bmax = get_bmax(B)
+
     divnorm = colors.TwoSlopeNorm(vmin=-bmax, vcenter=0, vmax=bmax)
     cs = np.linspace(-bmax,bmax,levels)
 
 
-    lon2D = p2D - np.pi
-    lat2D = np.pi/2 - th2D
-
     try:
         import cartopy.crs as ccrs
     except:
         print("cartopy library not available, using Hammer projection")
         proj = 'hammer'
 
+    xx,yy,transform = proj_coords(p2D,th2D,proj=proj)
+
     if proj.lower() == 'hammer':
         ax = plt.axes()
-        xx,yy = hammer2cart(lat2D,lon2D)
         cont = ax.contourf(xx,yy,B,cs,cmap=cmap,norm=divnorm,extend='both')
     else:
-        projection = eval('ccrs.'+proj+'()')
+        ax = plt.axes(projection=get_projection(proj))
 
-        ax = plt.axes(projection=projection)
-
-        cont = ax.contourf(lon2D*180/np.pi,lat2D*180/np.pi,B,cs,  \
-            transform=ccrs.PlateCarree(),cmap=cmap,norm=divnorm,extend='both')
+        cont = ax.contourf(xx,yy,B,cs,  \
+            transform=transform,cmap=cmap,norm=divnorm,extend='both')
 
     cbar = plt.colorbar(cont,orientation='horizontal',fraction=0.06, pad=0.04,ticks=[-bmax,0,bmax])
 
@@ -87,17 +164,7 @@ def plotB(p2D,th2D,B,r=1,planet="earth",levels=60,cmap='RdBu_r',proj='Mollweide'
 def plotB_subplot(p2D,th2D,B,ax,planet="earth",levels=60,cmap='RdBu_r',proj='Mollweide'):
     planet = planet.lower()
 
-    bmax = np.abs(B).max()
-    digits = int(np.log10(bmax)) + 1
-
-    if digits > 1:
-        bmax = np.round(bmax)
-    else:
-        bmax = np.round(bmax,decimals=1)
-
-    p2D -= np.pi
-    th2D -= np.pi/2
-    th2D = -th2D
+    bmax = get_bmax(B)
 
     cs = np.linspace(-bmax,bmax,levels)
     divnorm = colors.TwoSlopeNorm(vmin=-bmax, vcenter=0, vmax=bmax)
@@ -108,15 +175,16 @@ def plotB_subplot(p2D,th2D,B,ax,planet="earth",levels=60,cmap='RdBu_r',proj='Mol
         print("cartopy library not available, using Hammer projection")
         proj = 'hammer'
 
+    xx,yy,transform = proj_coords(p2D,th2D,proj=proj)
+
     if proj.lower() == 'hammer':
-        xx,yy = hammer2cart(th2D,p2D)
         cont = ax.contourf(xx,yy,B,cs,cmap=cmap,norm=divnorm,extend='both')
     else:
         if planet == "earth":
             ax.coastlines()
 
-        cont = ax.contourf(p2D*180/np.pi,th2D*180/np.pi,B,cs,  \
-            transform=ccrs.PlateCarree(),cmap=cmap,norm=divnorm,extend='both')
+        cont = ax.contourf(xx,yy,B,cs,  \
+            transform=transform,cmap=cmap,norm=divnorm,extend='both')
 
     cbar = plt.colorbar(cont,orientation='horizontal',fraction=0.06, pad=0.04,ticks=[-bmax,0,bmax])
     cbar.ax.tick_params(labelsize=15)
@@ -2,73 +2,57 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+from .libsht import sht
 
 def extrapot(lmax,rcmb,brcmb,rout):
 
     nphi, ntheta = brcmb.shape
-    nrout = len(rout)
-
-    polar_opt = 1e-10
 
     lmax = int(nphi/3)
     mmax = lmax
 
-    try:
-        import shtns
-    except ImportError:
-        print("Potential extrapolation requires the SHTns library")
-        print("It can be obtained here: https://bitbucket.org/nschaeff/shtns")
-
-    norm=shtns.sht_orthonormal | shtns.SHT_NO_CS_PHASE
-
-    sh = shtns.sht(lmax,mmax=mmax,norm=norm)
-    ntheta, nphi = sh.set_grid(ntheta, nphi, polar_opt=polar_opt)
-
+    sh = sht(lmax,mmax=mmax)
+    ntheta, nphi = sh.set_grid(ntheta, nphi)
 
     L = sh.l * (sh.l + 1)
 
     brlm = sh.analys(brcmb.T)
     bpolcmb = np.zeros_like(brlm)
     bpolcmb[1:] = rcmb**2 * brlm[1:]/L[1:]
-    btor = np.zeros_like(brlm)
 
-    brout = np.zeros([ntheta,nphi,nrout])
-    btout = np.zeros([ntheta,nphi,nrout])
-    bpout = np.zeros([ntheta,nphi,nrout])
+    # All radii are synthesised at once, coefficients have shape [nrout,nlm]
 
-    for k,radius in enumerate(rout):
-        print(("%d/%d" %(k,nrout)))
+    radius = np.asarray(rout,dtype=np.float64)[:,None]
 
-        radratio = rcmb/radius
-        bpol = bpolcmb * radratio**(sh.l)
-        brlm = bpol * L/radius**2
-        brout[...,k] = sh.synth(brlm)
+    radratio = rcmb/radius
+    bpol = bpolcmb * radratio**(sh.l)
+    brlm = bpol * L/radius**2
+    brout = sh.synth(brlm)
 
-        dbpoldr = -sh.l/radius * bpol
-        slm = dbpoldr
+    dbpoldr = -sh.l/radius * bpol
+    slm = dbpoldr/radius
+    btor = np.zeros_like(slm)
 
-        btout[...,k], bpout[...,k] = sh.synth(slm,btor)
+    btout, bpout = sh.synth(slm,btor)
 
-    brout = np.transpose(brout,(1,0,2))
-    btout = np.transpose(btout,(1,0,2))
-    bpout = np.transpose(bpout,(1,0,2))
+    brout = np.transpose(brout,(2,1,0))
+    btout = np.transpose(btout,(2,1,0))
+    bpout = np.transpose(bpout,(2,1,0))
 
     return brout, btout, bpout
 
 def get_grid(r,theta,phi):
 
-    nr,ntheta,nphi = len(r),len(theta),len(phi)
+    '''
+    Spherical and Cartesian coordinates of the [nphi, ntheta, nr] volume
+    grid, built by broadcasting the 1D arrays
+    '''
 
-    r3D  = np.zeros([nphi,ntheta,nr])
-    th3D = np.zeros([nphi,ntheta,nr])
-    p3D  = np.zeros([nphi,ntheta,nr])
+    shape = (len(phi),len(theta),len(r))
 
-    for i in range(nr):
-        r3D[...,i] = r[i]
-    for j in range(ntheta):
-        th3D[:,j,:] = theta[j]
-    for k in range(nphi):
-        p3D[k,...] = phi[k]
+    r3D  = np.broadcast_to(np.asarray(r)[None,None,:],shape)
+    th3D = np.broadcast_to(np.asarray(theta)[None,:,None],shape)
+    p3D  = np.broadcast_to(np.asarray(phi)[:,None,None],shape)
 
     s = r3D * np.sin(th3D)
     x = s *   np.cos(p3D)
@@ -87,34 +71,244 @@ def get_cart(vr,vt,vp,r3D,th3D,p3D):
 
     return vx,vy,vz
 
-def writeVts(name,br,btheta,bphi,r,theta,phi):
+def _chunks(nr,chunk):
+
+    return [slice(i,min(i+chunk,nr)) for i in range(0,nr,chunk)]
+
+def _field_chunk(field,r,sl):
+
+    '''
+    Field at the radii r[sl], from a function of the radii or by slicing
+    a tuple (br, btheta, bphi) of arrays on the whole grid
+    '''
+
+    if callable(field):
+        return field(r[sl])
+    else:
+        return tuple(b[...,sl] for b in field)
+
+def _cart_chunk(field,r,theta,phi,sl):
+
+    '''
+    Field and Cartesian coordinates/components of the radii r[sl]
+    '''
+
+    br, bt, bp = _field_chunk(field,r,sl)
+
+    r3D,th3D,p3D, x,y,z, s = get_grid(r[sl],theta,phi)
+    bx,by,bz = get_cart(br,bt,bp,r3D,th3D,p3D)
+
+    return br, r3D, (x,y,z), (bx,by,bz)
+
+def _load_progress(path,meta):
+
+    import json, os
+
+    if os.path.exists(path):
+        with open(path) as f:
+            prog = json.load(f)
+        if prog['meta'] == meta:
+            return set(prog['done'])
+
+    return None
+
+def _save_progress(path,meta,done):
+
+    import json, os
+
+    tmp = path + '.tmp'
+    with open(tmp,'w') as f:
+        json.dump({'meta': meta, 'done': sorted(done)},f)
+    os.replace(tmp,path)
+
+def _grid_meta(r,theta,phi,chunk):
+
+    '''
+    Record identifying an export: grid shape, chunk size and hash of the
+    coordinates
+    '''
+
+    import hashlib
+
+    return {'shape': [len(phi),len(theta),len(r)], 'chunk': chunk,
+            'grid': hashlib.sha1(r.tobytes() + theta.tobytes() + phi.tobytes()).hexdigest()}
+
+def streamVts(name,field,r,theta,phi,chunk=16):
+
+    '''
+    Write the field on the [nphi, ntheta, nr] grid to the VTK structured
+    grid file name.vts, chunk radii at a time. field(rc) returns br, btheta,
+    bphi of shape [nphi, ntheta, len(rc)], or field is the tuple of these
+    arrays on the whole grid. The file is laid out with raw
+    appended data, in which every radial chunk is a contiguous block of
+    each array, so only one chunk is ever held in memory. Completed chunks
+    are recorded in name.vts.part, so an interrupted export restarts
+    where it stopped when called again with the same grid.
+    '''
+
+    import os
+
+    r = np.asarray(r,dtype=np.float64)
+    theta = np.asarray(theta,dtype=np.float64)
+    phi = np.asarray(phi,dtype=np.float64)
+
+    nphi, ntheta, nr = len(phi), len(theta), len(r)
+    npts = nphi * ntheta * nr
+
+    fname = "%s.vts" %name
+    part = fname + '.part'
+
+    print("grid shape=",(nphi,ntheta,nr))
+
+    # Arrays of the appended data: (name, number of components)
 
-    r3D,th3D,p3D, x,y,z, s = get_grid(r,theta,phi)
+    arrays = [('radius',1), ('Radial mag field',1), ('Mag Field',3), ('Points',3)]
 
-    print("grid shape=",th3D.shape)
+    offsets = {}
+    pos = 0
+    for aname, ncomp in arrays:
+        offsets[aname] = pos
+        pos += 8 + 8*ncomp*npts
 
-    bx,by,bz = get_cart(br, btheta, bphi,r3D,th3D,p3D)
+    def data_array(aname,ncomp):
+        nameattr = '' if aname == 'Points' else ' Name="%s"' %aname
+        return ('<DataArray type="Float64"%s NumberOfComponents="%d" format="appended" offset="%d"/>\n'
+                %(nameattr,ncomp,offsets[aname]))
+
+    extent = "0 %d 0 %d 0 %d" %(nphi-1,ntheta-1,nr-1)
+
+    header = ('<?xml version="1.0"?>\n'
+              '<VTKFile type="StructuredGrid" version="1.0" byte_order="LittleEndian" header_type="UInt64">\n'
+              '<StructuredGrid WholeExtent="%s">\n<Piece Extent="%s">\n<PointData>\n' %(extent,extent)
+              + ''.join(data_array(a,c) for a, c in arrays[:3])
+              + '</PointData>\n<Points>\n' + data_array(*arrays[3])
+              + '</Points>\n</Piece>\n</StructuredGrid>\n<AppendedData encoding="raw">\n_').encode()
+    footer = b'\n</AppendedData>\n</VTKFile>\n'
+
+    meta = _grid_meta(r,theta,phi,chunk)
+
+    done = _load_progress(part,meta) if os.path.exists(fname) else None
+
+    if done is None:
+        done = set()
+        with open(fname,'wb') as f:
+            f.write(header)
+            for aname, ncomp in arrays:
+                f.seek(len(header) + offsets[aname])
+                f.write(np.uint64(8*ncomp*npts).tobytes())
+            f.seek(len(header) + pos)
+            f.write(footer)
+        _save_progress(part,meta,done)
+
+    nlayer = nphi * ntheta
+
+    with open(fname,'r+b') as f:
+        for k, sl in enumerate(_chunks(nr,chunk)):
+            if k in done:
+                continue
+
+            br, r3D, xyz, bxyz = _cart_chunk(field,r,theta,phi,sl)
+
+            # Fortran order: phi fastest, radius slowest; vectors interleaved
+
+            blocks = {'radius': [r3D],
+                      'Radial mag field': [br],
+                      'Mag Field': bxyz,
+                      'Points': xyz}
+
+            for aname, ncomp in arrays:
+                comps = [np.transpose(c,(2,1,0)) for c in blocks[aname]]
+                data = np.stack(comps,axis=-1).astype('<f8')
+                f.seek(len(header) + offsets[aname] + 8 + 8*ncomp*nlayer*sl.start)
+                f.write(data.tobytes())
+
+            f.flush()
+            done.add(k)
+            _save_progress(part,meta,done)
+
+    os.remove(part)
+
+def writeChunked(name,field,r,theta,phi,chunk=16):
+
+    '''
+    Write the field (a function of the radii or a tuple of arrays, as in
+    streamVts) on the [nphi, ntheta, nr] grid to the directory name,
+    one compressed .npz file per chunk of radii holding br, btheta, bphi
+    and the Cartesian components bx, by, bz. The coordinates are stored
+    in coords.npz. The grid and the chunk size are recorded in meta.json:
+    when called again with the same ones, chunks already written are
+    skipped, so an interrupted export resumes. Otherwise the chunks left
+    by the previous export are deleted. Read back with readChunked.
+    '''
+
+    import os, json
+
+    r = np.asarray(r,dtype=np.float64)
+    theta = np.asarray(theta,dtype=np.float64)
+    phi = np.asarray(phi,dtype=np.float64)
+
+    os.makedirs(name,exist_ok=True)
+
+    meta = _grid_meta(r,theta,phi,chunk)
+    metafile = os.path.join(name,'meta.json')
 
     try:
-        try: # Version 2 changed naming convention of functions
-            from evtk.hl import structuredToVTK
-            gridToVTK = structuredToVTK
-        except:
-            import evtk
-            gridToVTK = evtk.hl.gridToVTK
-    except:
-        try:
-            from pyevtk.hl import gridToVTK
-        except:
-            print("This requires the use of evtk library!")
-            print("You can get it from https://github.com/paulo-herrera/PyEVTK")
-
-
-    br = np.asfortranarray(br)
-    bx = np.asfortranarray(bx)
-    by = np.asfortranarray(by)
-    bz = np.asfortranarray(bz)
-
-    gridToVTK("%s"%name,x,y,z,pointData= {"radius":r3D,
-                                          "Radial mag field":br,
-                                          "Mag Field":(bx, by,bz)})
\ No newline at end of file
+        with open(metafile) as f:
+            resume = json.load(f) == meta
+    except (OSError,ValueError):
+        resume = False
+
+    if not resume:
+        for fname in os.listdir(name):
+            if fname.startswith('chunk_') or fname == 'coords.npz':
+                os.remove(os.path.join(name,fname))
+        np.savez(os.path.join(name,'coords.npz'),r=r,theta=theta,phi=phi,chunk=chunk)
+        with open(metafile + '.tmp','w') as f:
+            json.dump(meta,f)
+        os.replace(metafile + '.tmp',metafile)
+
+    for k, sl in enumerate(_chunks(len(r),chunk)):
+        fname = os.path.join(name,'chunk_%05d.npz' %k)
+        if os.path.exists(fname):
+            continue
+
+        br, bt, bp = _field_chunk(field,r,sl)
+        r3D,th3D,p3D, x,y,z, s = get_grid(r[sl],theta,phi)
+        bx,by,bz = get_cart(br,bt,bp,r3D,th3D,p3D)
+
+        tmp = fname + '.tmp.npz'
+        np.savez_compressed(tmp,br=br,btheta=bt,bphi=bp,bx=bx,by=by,bz=bz)
+        os.replace(tmp,fname)
+
+def readChunked(name,key='br',sl=slice(None)):
+
+    '''
+    Read one array of a store written by writeChunked for the radii r[sl],
+    loading only the chunks needed. Returns r and the array of shape
+    [nphi, ntheta, nr].
+    '''
+
+    import os
+
+    coords = np.load(os.path.join(name,'coords.npz'))
+    r = coords['r']
+    chunk = int(coords['chunk'])
+
+    irad = np.arange(len(r))[sl]
+    out = []
+
+    for k in np.unique(irad // chunk):
+        with np.load(os.path.join(name,'chunk_%05d.npz' %k)) as d:
+            sel = irad[irad // chunk == k] - k*chunk
+            out.append(d[key][...,sel])
+
+    return r[irad], np.concatenate(out,axis=-1)
+
+def writeVts(name,br,btheta,bphi,r,theta,phi,chunk=16):
+
+    '''
+    Write fields given on the whole [nphi, ntheta, nr] grid to name.vts,
+    see streamVts
+    '''
+
+    streamVts(name,(br,btheta,bphi),r,theta,phi,chunk=chunk)
@@ -1,11 +1,44 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-# import os
+import os
 from importlib_resources import files
 
 # stdDatDir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data/')
 stdDatDir = files('astroedu.planetmagfields').joinpath('data/')
 
 planetlist = ["mercury", "earth", "jupiter", "saturn", "uranus", "neptune",
-              "ganymede"]
\ No newline at end of file
+              "ganymede"]
+
+def get_cache_dir():
+
+    '''
+    Directory for files generated by planetmagfields: the directory given
+    by the environment variable PLANETMAGFIELDS_CACHE_DIR if it is set,
+    otherwise astroedu/planetmagfields under $XDG_CACHE_HOME (~/.cache by
+    default). PLANETMAGFIELDS_CACHE_DIR=install selects the astroedu
+    install directory (where config.ini lives), which must be writable.
+    Returns None if no directory can be created.
+    '''
+
+    from astroedu.__build__ import get_astroedu_path
+
+    path = os.environ.get('PLANETMAGFIELDS_CACHE_DIR')
+    if path == 'install':
+        path = os.path.join(get_astroedu_path(),'cache','planetmagfields')
+
+    cacheHome = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'),'.cache')
+
+    candidates = [path, os.path.join(cacheHome,'astroedu','planetmagfields')]
+
+    for path in candidates:
+        if path is None:
+            continue
+        try:
+            os.makedirs(path,exist_ok=True)
+        except OSError:
+            continue
+        if os.access(path,os.W_OK):
+            return path
+
+    return None
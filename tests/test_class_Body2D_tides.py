@@ -1,23 +1,151 @@
 import unittest
 import numpy as np
 
-from astroedu.classes import Body2D
+from astroedu.classes import Body2D, tide_cache
+from astroedu.classes.Body import tidal_forces, TidalForces
 from astroedu.constants import au
 
 class TestLoadData(unittest.TestCase):
     def test_Body2D_tides(self):
         '''
-        Test that the data loads as a pandas df
+        Test the tides against reference values, which were computed with
+        G = 6.67408e-11, the masses below and a zero cut of 1e-7
         '''
-        earth = Body2D.Earth(0, 0)
-        moon = Body2D.Moon(384400000/au, 0)
-        forces = earth.tides(moon, step=0.25, scale=5.972*10**24)
+        earth = Body2D('Earth', 0, 0, 6371, 5.972*10**24)
+        moon = Body2D('Moon', 384400000/au, 0, 1737.4, 7.34767309*10**22)
+        thetas = np.arange(0, 2*np.pi, 0.25*np.pi)
+        forces = tidal_forces(earth.x, earth.y, earth.r, earth.m, [moon.x], [moon.y], [moon.m],
+                              thetas, scale=5.972*10**24, zero_cut=1e-7, G=6.67408e-11).total()
         true_forces = [3.31874952061913e-05, np.array([3.43155527e-05, 3.39721024e-05, 3.31738253e-05, 3.24165524e-05,
              3.21141611e-05, 3.24165524e-05, 3.31738253e-05, 3.39721024e-05]), np.array([ 1.12805754e-06,  7.84607232e-07,  0.00000000e+00, -7.70942821e-07,
              -1.07333414e-06, -7.70942821e-07,  0.00000000e+00,  7.84607232e-07]), np.array([ 0.00000000e+00, -4.02857477e-07, -5.49819045e-07, -3.75505178e-07,
              -0.00000000e+00,  3.75505178e-07,  5.49819045e-07,  4.02857477e-07]), np.array([ 0.00000000e+00, -4.02857477e-07, -5.49819045e-07, -3.75505178e-07,
              0.00000000e+00,  3.75505178e-07,  5.49819045e-07,  4.02857477e-07])]
-        self.assertEqual(forces, true_forces, 'Forces are not equal')
+        self.assertEqual(len(forces), len(true_forces))
+        for f, true_f in zip(forces, true_forces):
+            np.testing.assert_allclose(f, true_f, rtol=1e-8, atol=1e-20, err_msg='Forces are not equal')
+
+    def test_Body2D_tides_api(self):
+        '''
+        Test Body2D.tides on the Earth-Moon example of the docs against the
+        vectorised engine
+        '''
+        earth = Body2D.Earth(0, 0)
+        moon = Body2D.Moon(384400000/au, 0)
+        forces = earth.tides(moon, step=0.25, scale=5.972*10**24)
+        self.assertIsInstance(forces, TidalForces)
+        force_c, force_p_h, force_p_h_diff, force_p_v, force_p_v_diff = forces
+        self.assertEqual(force_p_h.shape, (8,))
+
+        true_forces = tidal_forces(earth.x, earth.y, earth.r, earth.m, [moon.x], [moon.y], [moon.m],
+                                   np.arange(0, 2*np.pi, 0.25*np.pi), scale=5.972*10**24).total()
+        for f, true_f in zip(forces, true_forces):
+            np.testing.assert_allclose(f, true_f, rtol=1e-12, atol=1e-20)
+        self.assertAlmostEqual(force_c, 3.318325446328331e-05, delta=1e-15)
+        np.testing.assert_allclose(force_p_h_diff[[0, 4]], [1.127913395469e-06, -1.073196992322e-06], rtol=1e-9)
+
+    def test_Body2D_tides_bodies(self):
+        '''
+        Test that the combined tides of several bodies are the sums of the
+        forces of each body
+        '''
+        earth = Body2D.Earth(0.3, -0.2)
+        rng = np.random.default_rng(1)
+        bodies = [Body2D('Body%d' %i, 0.3 + x, -0.2 + y, 1000, m)
+                  for i, (x, y, m) in enumerate(zip(rng.uniform(-1e-3, 1e-3, 20),
+                                                    rng.uniform(-1e-3, 1e-3, 20),
+                                                    rng.uniform(1e20, 1e25, 20)))]
+        # bodies close to the axes through the centre of Earth
+        bodies += [Body2D('Near y', 0.3 + 1e-6, 0.1, 1, 1e22), Body2D('Near x', 0.1, -0.2 + 1e-6, 1, 1e22)]
+
+        forces = earth.tides(*bodies, step=0.1, scale=5.972*10**24)
+        self.assertIsInstance(forces, TidalForces)
+
+        true_forces = [0]*5
+        for body in bodies:
+            true_forces = [f + g for f, g in zip(true_forces, earth.forces(body))]
+        for f, true_f in zip(forces, true_forces):
+            np.testing.assert_allclose(f, true_f, rtol=1e-12, atol=0)
+
+        per_body = earth.tide_forces([[b.x/au, b.y/au] for b in bodies], [b.m for b in bodies],
+                                     step=0.1, scale=5.972*10**24)
+        self.assertEqual(per_body.force_p_h.shape, (len(bodies), len(earth.thetas)))
+        np.testing.assert_allclose(per_body.force_p_v_diff[3], earth.forces(bodies[3])[4], rtol=1e-9)
+
+        # no bodies, no tides
+        for cache in [True, False]:
+            forces = earth.tides(step=0.1, cache=cache)
+            self.assertIsInstance(forces, TidalForces)
+            self.assertEqual(forces.force_c, 0)
+            for f in forces[1:]:
+                np.testing.assert_array_equal(f, np.zeros(len(earth.thetas)))
+
+    def test_Body2D_tide_series(self):
+        '''
+        Test that the tides over a time series match the tides at each time,
+        whatever the chunk size
+        '''
+        earth = Body2D.Earth(0, 0)
+        t = np.linspace(0, 2*np.pi, 50)
+        moon = 384400000/au*np.stack([np.cos(t), np.sin(t)], axis=-1)
+        sun = np.broadcast_to([1, 0], moon.shape)
+        positions = np.stack([moon, sun], axis=1)
+        masses = [0.07346*10**24, 1988500*10**24]
+
+        series = earth.tide_series(positions, masses, step=0.1, scale=5.972*10**24)
+        self.assertEqual(series.force_p_h.shape, (50, 2, 20))
+
+        chunked = earth.tide_series(positions, masses, step=0.1, scale=5.972*10**24, chunk=7)
+        for f, g in zip(series, chunked):
+            np.testing.assert_array_equal(f, g)
+
+        total = series.total()
+        for k in [0, 13, 49]:
+            forces = earth.tides(Body2D('Moon', *moon[k], 1737.4, masses[0]), Body2D('Sun', 1, 0, 695700, masses[1]),
+                                 step=0.1, scale=5.972*10**24, cache=False)
+            for f, true_f in zip(total, forces):
+                np.testing.assert_allclose(f[k], true_f, rtol=1e-12, atol=0)
+
+        starts = [t0 for t0, f in earth.iter_tide_series(positions, masses, chunk=16)]
+        self.assertEqual(starts, [0, 16, 32, 48])
+
+        empty = earth.tide_series(positions[:0], masses, step=0.1)
+        self.assertEqual([f.shape for f in empty], [(0, 2)] + [(0, 2, 20)]*4)
+        self.assertEqual(empty.total().force_p_h.shape, (0, 20))
+        with self.assertRaises(ValueError):
+            earth.tide_series([], masses)
+
+    def test_Body2D_tide_cache(self):
+        '''
+        Test that the tides of each body are shared by Body2D objects through
+        the cache, also for geometries differing by round-off
+        '''
+        tide_cache.clear()
+        earth = Body2D.Earth(0.5, 0)
+        moon = Body2D.Moon(0.5 + 384400000/au, 0)
+        sun = Body2D.Sun(0, 0)
+        forces = earth.tides(moon, sun, step=0.1)
+        self.assertEqual(tide_cache.info()['misses'], 2)
+
+        other = Body2D.Earth(1.5, 1)
+        moved = other.tides(Body2D.Moon(1.5 + 384400000/au, 1), Body2D.Sun(1, 1*(1 + 1e-15)), step=0.1)
+        info = tide_cache.info()
+        self.assertEqual((info['hits'], info['misses'], info['entries']), (2, 2, 2))
+        for f, g in zip(forces, moved):
+            np.testing.assert_array_equal(f, g)
+
+        uncached = earth.tides(moon, sun, step=0.1, cache=False)
+        for f, g in zip(forces, uncached):
+            np.testing.assert_array_equal(f, g)
+
+        earth.tides(moon, step=0.2)
+        self.assertEqual(tide_cache.info()['entries'], 3)
+
+        tide_cache.resize(tide_cache.nbytes - 1)
+        self.assertEqual(tide_cache.info()['entries'], 2)
+        self.assertEqual(tide_cache.info()['evictions'], 1)
+        tide_cache.resize(64*2**20)
+        tide_cache.clear()
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+
+from astroedu.classes import Body2D, BodySystem
+from astroedu.constants import au
+
+class TestBodySystem(unittest.TestCase):
+    def setUp(self):
+        self.sun = Body2D.Sun(0, 0)
+        self.earth = Body2D.Earth(1, 0)
+        self.moon = Body2D.Moon(1 + 384400000/au, 0.001)
+        self.system = BodySystem(self.sun, self.earth, self.moon)
+
+    def test_views(self):
+        '''
+        Test that bodies read and write the arrays of their system
+        '''
+        system = self.system
+        self.assertIs(self.earth.system, system)
+        self.assertEqual(len(system), 3)
+        np.testing.assert_array_equal(system.positions[1], [au.value, 0])
+
+        self.earth.x += 1000
+        self.assertEqual(system.positions[1, 0], au.value + 1000)
+        system.masses[2] = 1e22
+        self.assertEqual(self.moon.m, 1e22)
+        system[-1].name = 'Luna'
+        self.assertEqual(self.moon.name, 'Luna')
+        self.assertEqual([body.name for body in system], ['Sun', 'Earth', 'Luna'])
+
+        with self.assertRaises(AttributeError):
+            self.earth.colour = 'blue'
+
+        self.assertEqual(system[np.int64(1)].name, 'Earth')
+        for key in [slice(0, 2), [0, 1], 1.0]:
+            with self.assertRaises(TypeError):
+                system[key]
+        with self.assertRaises(IndexError):
+            system[3]
+
+    def test_pairwise(self):
+        '''
+        Test the pairwise distances, angles and forces against those of
+        the bodies
+        '''
+        system = self.system
+        distances, angles = system.distances(), system.angles()
+        forces = system.forces(scale=5.972*10**24)
+        for i, a in enumerate(system):
+            a.scale = 5.972*10**24
+            for j, b in enumerate(system):
+                if i != j:
+                    self.assertAlmostEqual(distances[i, j], a.distance_to(b), delta=1e-6)
+                    self.assertAlmostEqual(angles[i, j], a.angle_to(b), delta=1e-14)
+                    self.assertAlmostEqual(forces[i, j]/a.force_centre(b), 1, delta=1e-14)
+        np.testing.assert_array_equal(np.diag(forces), 0)
+
+        net = system.net_forces()
+        true_net = [sum(forces[1, j]*5.972*10**24*np.array([np.cos(angles[1, j]), np.sin(angles[1, j])])
+                        for j in [0, 2])]
+        np.testing.assert_allclose(net[1], true_net[0], rtol=1e-12)
+        np.testing.assert_allclose(net.sum(axis=0), 0, atol=1e-9*np.abs(net).max())
+
+    def test_tides(self):
+        '''
+        Test the tides on a body of the system due to all the others
+        '''
+        forces = self.system.tides(1, step=0.1).total()
+        true_forces = self.earth.tides(self.sun, self.moon, step=0.1, cache=False)
+        for f, true_f in zip(forces, true_forces):
+            np.testing.assert_allclose(f, true_f, rtol=1e-12)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+
+from astroedu.classes import Body2D, BodySystem
+from astroedu.classes.integrator import Integrator, accelerations
+from astroedu.constants import au
+
+class TestIntegrator(unittest.TestCase):
+    def earth_orbit(self):
+        sun = Body2D.Sun(0, 0)
+        earth = Body2D('Earth', 1, 0, 6371, 5.9724*10**24, vy=29.78)
+        return earth, BodySystem(sun, earth)
+
+    def test_accelerations(self):
+        '''
+        Test the accelerations against the net forces of the system
+        '''
+        rng = np.random.default_rng(2)
+        system = BodySystem.from_arrays(['Body%d' %i for i in range(30)], rng.normal(size=(30, 2)),
+                                        np.ones(30), rng.uniform(1e22, 1e26, 30))
+        acc, tmin = accelerations(system.positions, system.masses, tmin=True)
+        np.testing.assert_allclose(acc, system.net_forces()/system.masses[:, None], rtol=1e-10)
+        dist = system.distances()
+        np.fill_diagonal(dist, np.inf)
+        true_tmin = np.sqrt(dist**3/(6.6743e-11*(system.masses[:, None] + system.masses[None, :]))).min()
+        self.assertAlmostEqual(tmin/true_tmin, 1, delta=1e-12)
+
+    def test_orbit(self):
+        '''
+        Test that Earth comes back after a year with a bounded energy error,
+        the bodies following the integration
+        '''
+        for method, error in [('leapfrog', 1e-9), ('yoshida', 1e-12)]:
+            earth, system = self.earth_orbit()
+            integrator = Integrator(system, method=method)
+            snaps = integrator.run(365*24, dt=3600, every=24)
+            self.assertEqual(snaps.positions.shape, (366, 2, 2))
+            self.assertEqual(snaps.times[-1], 365*24*3600)
+            np.testing.assert_array_equal(snaps.positions[-1], system.positions)
+            self.assertEqual(earth.x, system.positions[1, 0])
+            self.assertAlmostEqual(earth.x/au, 1, delta=1e-3)
+            self.assertAlmostEqual(earth.y/au, 0, delta=2e-3)
+            self.assertLess(snaps.energy_error().max(), error)
+
+    def test_adaptive(self):
+        '''
+        Test the adaptive timestep on an eccentric orbit
+        '''
+        sun = Body2D.Sun(0, 0)
+        comet = Body2D('Comet', 5, 0, 10, 1e14, vy=3)
+        system = BodySystem(sun, comet)
+        snaps = Integrator(system, method='yoshida').run(5000, eta=0.01, every=50)
+        self.assertEqual(len(snaps.times), 101)
+        self.assertTrue(np.all(np.diff(snaps.times) > 0))
+        self.assertLess(snaps.energy_error().max(), 1e-6)
+        self.assertLess(np.hypot(*snaps.positions[:, 1].T).min(), 0.5*au.value)
+
+        with self.assertRaises(ValueError):
+            Integrator(system).run(10)
+
+        # a single body has no free-fall time: dt is used, or an error raised
+        single = BodySystem(Body2D('Probe', 1, 0, 1, 1000, vy=10))
+        snaps = Integrator(single).run(10, dt=60, eta=0.01)
+        np.testing.assert_allclose(snaps.times, 60*np.arange(11))
+        np.testing.assert_allclose(single.positions[0], [au.value, 6e6])
+        with self.assertRaises(ValueError):
+            Integrator(single).run(10, eta=0.01)
+        with self.assertRaises(ValueError):
+            Integrator(system, method='euler')
+
+if __name__ == '__main__':
+    unittest.main()
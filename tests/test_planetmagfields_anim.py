@@ -0,0 +1,30 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from astroedu.planetmagfields import fieldanim
+from astroedu.planetmagfields.libgauss import get_grid
+
+class TestAnim(unittest.TestCase):
+    def test_frames(self):
+        '''
+        Test that frames reuse the figure and follow the data
+        '''
+        p2D, th2D = get_grid(nphi=32, ntheta=16)
+        fields = np.stack([np.cos(th2D), -np.cos(th2D)])
+        for mode in ['mesh', 'contour']:
+            anim = fieldanim(p2D, th2D, vmax=1., proj='hammer', mode=mode, figsize=(4,3))
+            img0 = anim.frame(fields[0], title='a').copy()
+            fig = anim.fig
+            img1 = anim.frame(fields[1], title='b')
+            self.assertIs(anim.fig, fig)
+            self.assertEqual(img1.shape, (300, 400, 4))
+            self.assertFalse(np.array_equal(img0, img1))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            anim.save_frames(fields, os.path.join(tmp, 'f_%02d.png'), start=3)
+            self.assertEqual(sorted(os.listdir(tmp)), ['f_03.png', 'f_04.png'])
+
+if __name__ == '__main__':
+    unittest.main()
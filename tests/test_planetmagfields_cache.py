@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+from importlib.util import find_spec
+import numpy as np
+
+from astroedu.planetmagfields import planet
+from astroedu.lru import LRUCache
+from astroedu.planetmagfields.libcache import basis_cache, diskcache, disk_cache, set_disk_cache, field_key
+from astroedu.planetmagfields.libgauss import get_grid
+from astroedu.planetmagfields.plotlib import proj_coords, proj_cache, hammer2cart
+
+class TestCache(unittest.TestCase):
+    def test_lru_bytes(self):
+        '''
+        Test hit/miss counting and eviction by size
+        '''
+        cache = LRUCache(maxbytes=2*800)
+        a = cache.get('a', lambda: np.zeros(100))
+        cache.get('b', lambda: np.zeros(100))
+        self.assertIs(cache.get('a', lambda: np.ones(100)), a)
+        cache.get('c', lambda: np.zeros(100))
+        info = cache.info()
+        self.assertEqual((info['hits'], info['misses'], info['evictions']), (1, 3, 1))
+        self.assertEqual(info['nbytes'], 1600)
+        # 'b' was the least recently used entry
+        self.assertEqual(cache.get('b', lambda: np.ones(100))[0], 1.)
+        self.assertFalse(a.flags.writeable)
+
+    def test_proj_coords(self):
+        '''
+        Test that projected grids are computed once and inputs are untouched
+        '''
+        p2D, th2D = get_grid(nphi=16, ntheta=8)
+        p0, t0 = p2D.copy(), th2D.copy()
+        proj_cache.clear()
+        xx, yy, transform = proj_coords(p2D, th2D, proj='Hammer')
+        xx2, yy2, transform = proj_coords(p2D, th2D, proj='hammer')
+        self.assertIs(xx, xx2)
+        self.assertEqual(proj_cache.info()['hits'], 1)
+        ref = hammer2cart(np.pi/2 - th2D, p2D - np.pi)
+        np.testing.assert_allclose(xx, ref[0])
+        np.testing.assert_allclose(yy, ref[1])
+        np.testing.assert_array_equal(p2D, p0)
+        np.testing.assert_array_equal(th2D, t0)
+
+    @unittest.skipUnless(find_spec('cartopy'), 'cartopy not installed')
+    def test_proj_coords_cartopy(self):
+        '''
+        Test that cartopy maps get longitude and latitude in degrees with
+        the PlateCarree transform, shared by all projections
+        '''
+        import cartopy.crs as ccrs
+        import matplotlib.pyplot as plt
+        from astroedu.planetmagfields.plotlib import plotSurf
+
+        p2D, th2D = get_grid(nphi=16, ntheta=8)
+        proj_cache.clear()
+        xx, yy, transform = proj_coords(p2D, th2D, proj='Mollweide')
+        self.assertIsInstance(transform, ccrs.PlateCarree)
+        np.testing.assert_allclose(xx, np.degrees(p2D - np.pi))
+        np.testing.assert_allclose(yy, np.degrees(np.pi/2 - th2D))
+        xx2, yy2, transform = proj_coords(p2D, th2D, proj='Robinson')
+        self.assertIs(xx, xx2)
+
+        ax, cbar = plotSurf(p2D, th2D, np.cos(th2D), proj='Mollweide')
+        self.assertIsInstance(ax.projection, ccrs.Mollweide)
+        self.assertTrue(ax.collections)
+        plt.close('all')
+
+    def test_disk_cache(self):
+        '''
+        Test storing, copy-on-write reads and size-capped eviction
+        '''
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = diskcache(path=tmp, maxbytes=2*800+2*128, enabled=True)
+            keys = [field_key('test', np.arange(3), k) for k in range(3)]
+            cache.get(keys[0], lambda: np.zeros(100))
+            b = cache.get(keys[0], lambda: np.ones(100))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            np.testing.assert_array_equal(b, 0.)
+            b[:] = 5.
+            np.testing.assert_array_equal(cache.get(keys[0], lambda: None), 0.)
+
+            os.utime(os.path.join(tmp, keys[0]+'.npy'), (1, 1))
+            cache.get(keys[1], lambda: np.zeros(100))
+            cache.get(keys[2], lambda: np.zeros(100))
+            self.assertEqual(cache.evictions, 1)
+            self.assertFalse(os.path.exists(os.path.join(tmp, keys[0]+'.npy')))
+
+    def test_disk_cache_planet(self):
+        '''
+        Test that a new planet instance reads its field from the disk cache
+        '''
+        with tempfile.TemporaryDirectory() as tmp:
+            set_disk_cache(True, path=tmp)
+            try:
+                disk_cache.clear()
+                Br = planet('jupiter', nphi=32, info=False).Br_at(0.9)
+                basis_cache.clear()
+                Br2 = planet('jupiter', nphi=32, info=False).Br_at(0.9)
+                self.assertEqual((disk_cache.hits, disk_cache.misses), (1, 1))
+                np.testing.assert_array_equal(Br, Br2)
+            finally:
+                set_disk_cache(False)
+                disk_cache.path = None
+
+    def test_planet_memo(self):
+        '''
+        Test that the memoised fields are writable copies held by the
+        bounded basis cache
+        '''
+        basis_cache.clear()
+        p = planet('mercury', nphi=32, info=False)
+        Br = p.Br
+        self.assertTrue(Br.flags.writeable)
+        Br[:] = 0
+        self.assertGreater(np.abs(p.Br).max(), 0)
+        self.assertIsNotNone(basis_cache.lookup(('Br', 1.0) + p._memo_key()))
+
+if __name__ == '__main__':
+    unittest.main()
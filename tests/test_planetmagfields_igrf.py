@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+
+from astroedu.planetmagfields import planet, igrf
+from astroedu.planetmagfields.igrf import decimal_year
+
+class TestIGRF(unittest.TestCase):
+    def test_coeffs(self):
+        '''
+        Test interpolation between epochs and extrapolation with the SV
+        '''
+        e = igrf(nphi=32)
+        g, h = e.coeffs([1902.5, 2020, 2022])
+        self.assertAlmostEqual(g[0,e.idx[1,0]], (-31543 + -31464)/2)
+        self.assertAlmostEqual(g[1,e.idx[1,0]], -29404.8)
+        self.assertAlmostEqual(g[2,e.idx[1,0]], -29404.8 + 2*5.7)
+        self.assertAlmostEqual(h[2,e.idx[1,1]], 4652.5 - 2*25.9)
+
+    def test_dates(self):
+        '''
+        Test mixed dates and the warning beyond the validity of the SV
+        '''
+        from datetime import date
+        t = decimal_year(np.array([2000.0, np.datetime64('2010-01-01'), date(2015, 7, 2)], dtype=object))
+        np.testing.assert_allclose(t, [2000., 2010., 2015.5], atol=1e-2)
+
+        e = igrf(nphi=32)
+        g, h = e.coeffs(np.array([2000.0, np.datetime64('2010-01-01')], dtype=object))
+        self.assertAlmostEqual(g[1,e.idx[1,0]], e.coeffs([2010])[0][0,e.idx[1,0]])
+        with self.assertWarns(UserWarning):
+            e.coeffs([2030])
+
+    def test_Br(self):
+        '''
+        Test that the batched field at 2020 is the field of planet('earth')
+        '''
+        e = igrf(nphi=32)
+        p = planet('earth', nphi=32, info=False)
+        Br = e.Br([1990, 2020])
+        self.assertEqual(Br.shape, (2, 32, 16))
+        np.testing.assert_allclose(Br[1], p.Br, atol=1e-10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+
+from astroedu.planetmagfields.libbfield import compute_fields, synthBr_all, plotAllFields
+from astroedu.planetmagfields.utils import planetlist
+
+class TestParallel(unittest.TestCase):
+    def test_compute_fields(self):
+        '''
+        Test that the fields computed by the process pool equal the
+        serial synthesis
+        '''
+        names = ['earth', 'mercury', 'jupiter']
+        fields = compute_fields(names, r=0.9, nworkers=2, nphi=32)
+        p2D, th2D, Ball = synthBr_all(names, r=0.9, nphi=32)
+        self.assertEqual(list(fields), names)
+        for k, name in enumerate(names):
+            np.testing.assert_allclose(fields[name][0], Ball[k], rtol=1e-12, atol=1e-12*np.abs(Ball[k]).max())
+
+    def test_plot_parallel(self):
+        '''
+        Test the parallel plot with worker-side rendering, which must not
+        change the backend of this process
+        '''
+        backend = matplotlib.get_backend()
+        plotAllFields(proj='hammer', parallel=True, render=True, nworkers=2, nphi=32)
+        fig = plt.gcf()
+        self.assertEqual(len([ax for ax in fig.axes if ax.images]), len(planetlist))
+        plt.close(fig)
+        plotAllFields(proj='hammer', parallel=True, nworkers=2, nphi=32)
+        plt.close('all')
+        self.assertEqual(matplotlib.get_backend(), backend)
+
+if __name__ == '__main__':
+    unittest.main()
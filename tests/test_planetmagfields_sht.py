@@ -0,0 +1,101 @@
+import os
+import re
+import tempfile
+import unittest
+import numpy as np
+
+from astroedu.planetmagfields import planet, extrapot
+from astroedu.planetmagfields.libgauss import getB
+from astroedu.planetmagfields.libsht import sht
+from astroedu.planetmagfields.potextra import streamVts, writeChunked, readChunked, get_grid, get_cart
+
+class TestSHT(unittest.TestCase):
+    def test_round_trip(self):
+        '''
+        Test that analysis recovers the coefficients used for synthesis
+        '''
+        sh = sht(20)
+        sh.set_grid(32, 64)
+        rng = np.random.default_rng(1)
+        qlm = rng.standard_normal(sh.nlm) + 1j*rng.standard_normal(sh.nlm)
+        qlm[sh.m == 0] = qlm[sh.m == 0].real
+        np.testing.assert_allclose(sh.analys(sh.synth(qlm)), qlm, atol=1e-10)
+
+        for nlat, nphi, closed in [(20, 64, True), (32, 41, True), (32, 40, False)]:
+            with self.assertRaises(ValueError):
+                sh.set_grid(nlat, nphi, closed=closed)
+        sh.set_grid(21, 41, closed=False)
+
+    def test_extrapot(self):
+        '''
+        Test that the extrapolated field matches direct synthesis at r=2
+        '''
+        p = planet('jupiter', nphi=64, info=False)
+        brout, btout, bpout = extrapot(p.lmax, 1., p.Br, [1., 2.])
+        Br2 = getB(p.lmax, p.glm, p.hlm, p.idx, 2., p.p2D, p.th2D, planet='jupiter') * 1e-3
+        self.assertEqual(brout.shape, (64, 32, 2))
+        np.testing.assert_allclose(brout[...,1], Br2, atol=1e-8*np.abs(Br2).max())
+
+        Br, Bt, Bp = p.Br_stack([2.], vector=True)
+        np.testing.assert_allclose(btout[...,1], Bt[0], atol=1e-8*np.abs(Bt).max())
+        np.testing.assert_allclose(bpout[...,1], Bp[0], atol=1e-8*np.abs(Bp).max())
+
+    def test_export(self):
+        '''
+        Test the streamed vts file and the chunked store, including
+        resuming an interrupted export
+        '''
+        nphi, ntheta, nr = 6, 4, 7
+        phi = np.linspace(0, 2*np.pi, nphi)
+        theta = np.linspace(0.1, 3., ntheta)
+        r = np.linspace(1., 2., nr)
+        B = np.random.default_rng(0).standard_normal((3, nphi, ntheta, nr))
+
+        calls = []
+        def field(rc):
+            calls.append(len(rc))
+            if len(calls) == 2:
+                raise RuntimeError
+            k = np.searchsorted(r, rc)
+            return B[0][...,k], B[1][...,k], B[2][...,k]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            name = os.path.join(tmp, 'test')
+            with self.assertRaises(RuntimeError):
+                streamVts(name, field, r, theta, phi, chunk=3)
+            streamVts(name, field, r, theta, phi, chunk=3)
+            self.assertEqual(calls, [3, 3, 3, 1])
+            self.assertFalse(os.path.exists(name + '.vts.part'))
+
+            raw = open(name + '.vts', 'rb').read()
+            start = raw.index(b'encoding="raw">\n_') + 17
+            arrays = {}
+            for m in re.finditer(rb'Name="([^"]+)" NumberOfComponents="(\d)" format="appended" offset="(\d+)"', raw[:start]):
+                off = start + int(m.group(3))
+                nbytes = int(np.frombuffer(raw[off:off+8], '<u8')[0])
+                data = np.frombuffer(raw[off+8:off+8+nbytes], '<f8')
+                arrays[m.group(1).decode()] = data.reshape(nr, ntheta, nphi, int(m.group(2)))
+
+            r3D, th3D, p3D, x, y, z, s = get_grid(r, theta, phi)
+            bx, by, bz = get_cart(B[0], B[1], B[2], r3D, th3D, p3D)
+            np.testing.assert_allclose(arrays['Radial mag field'][...,0], B[0].T)
+            np.testing.assert_allclose(arrays['Mag Field'], np.stack([bx.T, by.T, bz.T], axis=-1))
+
+            writeChunked(name, tuple(B), r, theta, phi, chunk=3)
+            rr, bxc = readChunked(name, 'bx', slice(2, 6))
+            np.testing.assert_allclose(rr, r[2:6])
+            np.testing.assert_allclose(bxc, bx[...,2:6])
+
+            # a new export with other radii must not reuse the old chunks
+            self.assertTrue(os.path.exists(os.path.join(name, 'chunk_00002.npz')))
+            r2 = r[:4]*1.1
+            B2 = [b[...,:4]*2 for b in B]
+            writeChunked(name, tuple(B2), r2, theta, phi, chunk=3)
+            rr, brc = readChunked(name, 'br')
+            np.testing.assert_allclose(rr, r2)
+            np.testing.assert_allclose(brc, B2[0])
+            self.assertEqual(sorted(f for f in os.listdir(name) if f.startswith('chunk_')),
+                             ['chunk_00000.npz', 'chunk_00001.npz'])
+
+if __name__ == '__main__':
+    unittest.main()
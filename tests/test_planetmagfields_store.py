@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+
+from astroedu.planetmagfields.libgauss import get_data, read_data, get_igrf, read_igrf
+from astroedu.planetmagfields import planet
+from astroedu.planetmagfields.utils import stdDatDir, planetlist, get_cache_dir
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.datDir = Path(self.tmp, 'data')
+        shutil.copytree(str(stdDatDir), str(self.datDir))
+        os.environ['PLANETMAGFIELDS_CACHE_DIR'] = str(Path(self.tmp, 'cache'))
+
+    def tearDown(self):
+        del os.environ['PLANETMAGFIELDS_CACHE_DIR']
+        shutil.rmtree(self.tmp)
+
+    def test_store(self):
+        '''
+        Test that stored coefficients match the text files and are
+        rebuilt when a file changes
+        '''
+        for name in planetlist:
+            for a, b in zip(get_data(self.datDir, name), read_data(self.datDir, name)):
+                np.testing.assert_array_equal(a, b)
+        self.assertEqual(len(os.listdir(os.environ['PLANETMAGFIELDS_CACHE_DIR'])), len(planetlist))
+
+        datfile = self.datDir.joinpath('mercury.dat')
+        datfile.write_text(datfile.read_text().replace('-190', '-200'))
+        self.assertEqual(get_data(self.datDir, 'mercury')[0][1], -200.)
+
+    def test_cache_dir(self):
+        '''
+        Test that the cache goes to the user cache directory unless
+        another one is set
+        '''
+        self.assertEqual(get_cache_dir(), os.environ['PLANETMAGFIELDS_CACHE_DIR'])
+        xdg = os.environ.get('XDG_CACHE_HOME')
+        del os.environ['PLANETMAGFIELDS_CACHE_DIR']
+        os.environ['XDG_CACHE_HOME'] = self.tmp
+        try:
+            self.assertEqual(get_cache_dir(), os.path.join(self.tmp, 'astroedu', 'planetmagfields'))
+        finally:
+            os.environ['PLANETMAGFIELDS_CACHE_DIR'] = str(Path(self.tmp, 'cache'))
+            if xdg is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = xdg
+
+    def test_store_single_file(self):
+        '''
+        Test that a data directory holding only the file of one planet
+        loads that planet
+        '''
+        earthDir = Path(self.tmp, 'earth')
+        earthDir.mkdir()
+        shutil.copy(str(self.datDir.joinpath('IGRF13.dat')), str(earthDir))
+
+        p = planet('earth', datDir=earthDir)
+        np.testing.assert_array_equal(p.glm, read_data(self.datDir, 'earth')[0])
+        for a, b in zip(get_igrf(earthDir), read_igrf(self.datDir)):
+            np.testing.assert_array_equal(a, b)
+        with self.assertRaises(OSError):
+            get_data(earthDir, 'mercury')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import unittest
+import numpy as np
+from math import factorial
+from scipy.special import lpmv
+
+from astroedu.planetmagfields import planet
+from astroedu.planetmagfields.libgauss import gen_lm, get_plm, get_grid, get_data, getB, anaB, filt_Gauss, get_spec, getBtiled, getBpoints, getBrings, get_grid_reduced, nyquist_grid
+from astroedu.planetmagfields.libbfield import synthBr_all
+from astroedu.planetmagfields.utils import stdDatDir, planetlist
+
+class TestSynth(unittest.TestCase):
+    def test_plm_schmidt(self):
+        '''
+        Test the Legendre recurrence against scipy's lpmv
+        '''
+        lmax = 12
+        theta = np.linspace(0.01, np.pi-0.01, 17)
+        plm = get_plm(lmax, theta)
+        for k, (l, m) in enumerate(zip(*gen_lm(lmax))):
+            norm = 1. if m == 0 else np.sqrt(2*factorial(l-m)/factorial(l+m))
+            expected = (-1)**m * norm * lpmv(m, l, np.cos(theta))
+            np.testing.assert_allclose(plm[k], expected, rtol=1e-10, atol=1e-12)
+
+    def test_getB_dipole(self):
+        '''
+        Test that an axial dipole g10 gives Br = 2 g10 cos(theta) / r^3
+        '''
+        g, h, lmax, idx = get_data(stdDatDir, planet='jupiter')
+        glm = np.zeros_like(g)
+        hlm = np.zeros_like(h)
+        glm[idx[1,0]] = 1.
+        p2D, th2D = get_grid(nphi=32, ntheta=16)
+        Br = getB(lmax, glm, hlm, idx, 0.5, p2D, th2D, planet='jupiter')
+        np.testing.assert_allclose(Br, 2*np.cos(th2D)/0.5**3, atol=1e-12)
+
+    def test_anaB_round_trip(self):
+        '''
+        Test that anaB recovers the Gauss coefficients of a stack of maps
+        '''
+        g, h, lmax, idx = get_data(stdDatDir, planet='earth')
+        p2D, th2D = get_grid(nphi=64, ntheta=32)
+        radii = np.array([0.6, 1.])
+        Br = np.stack([getB(lmax, g, h, idx, r, p2D, th2D, planet='earth') for r in radii])
+        glm, hlm = anaB(lmax, Br, radii, p2D[:,0], th2D[0,:], planet='earth')
+        self.assertEqual(glm.shape, (2, len(g)))
+        np.testing.assert_allclose(glm, np.stack([g, g]), atol=1e-6)
+        np.testing.assert_allclose(hlm, np.stack([h, h]), atol=1e-6)
+
+        nphi, ntheta = nyquist_grid(lmax, pad=1)
+        p2D, th2D = get_grid(nphi=nphi, ntheta=ntheta)
+        Br = getB(lmax, g, h, idx, 1., p2D, th2D, planet='earth')
+        glm, hlm = anaB(lmax, Br, 1., p2D[:,0], th2D[0,:], planet='earth')
+        np.testing.assert_allclose(glm, g, atol=1e-6)
+        p2D, th2D = get_grid(nphi=nphi-2, ntheta=ntheta)
+        with self.assertRaises(ValueError):
+            anaB(lmax, Br[:-2], 1., p2D[:,0], th2D[0,:], planet='earth')
+        p2D, th2D = get_grid(nphi=16, ntheta=8)
+        with self.assertRaises(ValueError):
+            anaB(lmax, Br[:16,:8], 1., p2D[:,0], th2D[0,:], planet='earth')
+
+    def test_field_at(self):
+        '''
+        Test point evaluation against the grid field and the dipole Btheta
+        '''
+        p = planet('earth', nphi=32, info=False)
+        Br, Bt, Bp = p.field_at(1, p.th2D, p.p2D, chunk=100)
+        np.testing.assert_allclose(Br, p.Br, atol=1e-10)
+
+        p.glm[:] = 0.
+        p.hlm[:] = 0.
+        p.glm[p.idx[1,0]] = 1e3
+        theta = np.linspace(0, np.pi, 7)
+        Br, Bt, Bp = p.field_at(2., theta, 0.3)
+        np.testing.assert_allclose(Bt, np.sin(theta)/8, atol=1e-12)
+        np.testing.assert_allclose(Bp, 0., atol=1e-12)
+
+        # P_11/sin(theta) = 1, including at and next to the poles
+        p.glm[p.idx[1,0]] = 0.
+        p.glm[p.idx[1,1]] = 1e3
+        theta = np.array([0, 1e-10, 1e-6, 1., np.pi - 1e-10, np.pi])
+        Br, Bt, Bp = p.field_at(2., theta, 0.3)
+        np.testing.assert_allclose(Bp, -np.sin(0.3)/8, rtol=1e-12)
+
+    def test_filtered(self):
+        '''
+        Test filtered fields against the synthesis of filtered coefficients
+        '''
+        p = planet('earth', nphi=32, info=False)
+        g, h = filt_Gauss(p.glm, p.hlm, p.lmax, p.idx, lCutMin=2, lCutMax=5)
+        ref = 1e-3*getB(p.lmax, g, h, p.idx, 0.8, p.p2D, p.th2D, planet='earth')
+        np.testing.assert_allclose(p.Br_filtered(0.8, lCutMin=2, lCutMax=5), ref, atol=1e-10)
+
+        g, h = filt_Gauss(p.glm, p.hlm, p.lmax, p.idx, larr=[1,3], mmin=1)
+        ref = 1e-3*getB(p.lmax, g, h, p.idx, 0.8, p.p2D, p.th2D, planet='earth')
+        np.testing.assert_allclose(p.Br_filtered(0.8, larr=[1,3], mmin=1), ref, atol=1e-10)
+
+        # Cut-offs are inclusive
+        g, h = filt_Gauss(p.glm, p.hlm, p.lmax, p.idx, lCutMax=3)
+        self.assertTrue(np.all(g[p.idx[3,:4]] == p.glm[p.idx[3,:4]]))
+        self.assertTrue(np.all(g[p.idx[4,:5]] == 0.))
+
+        np.testing.assert_allclose(p.Br_degrees(0.8).sum(axis=0), p.Br_at(0.8), atol=1e-10)
+        np.testing.assert_allclose(p.Br_orders(0.8).sum(axis=0), p.Br_at(0.8), atol=1e-10)
+
+    def test_spec_batch(self):
+        '''
+        Test the batched spectrum against single radius calls and the
+        axial dipole energy
+        '''
+        g, h, lmax, idx = get_data(stdDatDir, planet='earth')
+        radii = np.array([0.5, 1., 2.])
+        E, emag_10 = get_spec(np.stack([g, 2*g]), np.stack([h, 2*h]), idx, lmax, r=radii)
+        self.assertEqual(E.shape, (2, 3, lmax+1))
+        for k, r in enumerate(radii):
+            E1, e1 = get_spec(g, h, idx, lmax, r=r)
+            np.testing.assert_allclose(E[0,k], E1)
+            np.testing.assert_allclose(E[1,k], 4*E1)
+            np.testing.assert_allclose(e1, 2*g[idx[1,0]]**2 / r**6)
+
+        p = planet('jupiter', nphi=32, info=False)
+        p.spec(r=[1., 0.8], iplot=False)
+        self.assertEqual(p.emag_spec.shape, (2, p.lmax+1))
+        self.assertEqual(p.dipolarity.shape, (2,))
+        self.assertTrue(np.all(p.dipolarity <= p.dip_tot))
+
+    def test_planets_stacked(self):
+        '''
+        Test the stacked synthesis of all planets against each planet
+        '''
+        radii = np.linspace(0.7, 1., len(planetlist))
+        p2D, th2D, Br = synthBr_all(planetlist, r=radii, nphi=32)
+        self.assertEqual(Br.shape, (len(planetlist), 32, 16))
+        for k, name in enumerate(planetlist):
+            p = planet(name, nphi=32, info=False)
+            np.testing.assert_allclose(Br[k], p.Br_at(radii[k]), rtol=1e-10, atol=1e-10)
+
+    def test_tiled(self):
+        '''
+        Test the banded threaded synthesis against the full grid one
+        '''
+        p = planet('jupiter', nphi=64, info=False)
+        Br = getBtiled(p.lmax, p.glm, p.hlm, 0.9, p.phi, p.theta, planet='jupiter',
+                       maxmem=5*2*64*8, nworkers=3)
+        ref = getB(p.lmax, p.glm, p.hlm, p.idx, 0.9, p.p2D, p.th2D, planet='jupiter')
+        np.testing.assert_allclose(Br, ref, rtol=1e-10, atol=1e-6)
+
+        Br32 = getBtiled(p.lmax, p.glm, p.hlm, 0.9, p.phi, p.theta, planet='jupiter',
+                         dtype=np.float32)
+        self.assertEqual(Br32.dtype, np.float32)
+        np.testing.assert_allclose(Br32, ref, atol=1e-5*np.abs(ref).max())
+
+    def test_grids(self):
+        '''
+        Test the grid builders and the synthesis on the reduced grid
+        '''
+        p2D, th2D = get_grid(nphi=16, ntheta=8)
+        self.assertEqual(p2D.shape, (16, 8))
+        np.testing.assert_allclose(p2D[:,3], np.linspace(0, 2*np.pi, 16))
+        np.testing.assert_allclose(th2D[5], th2D[0])
+        p2D, th2D = get_grid(nphi=16, ntheta=8, closed=False)
+        self.assertLess(p2D[-1,0], 2*np.pi)
+
+        g, h, lmax, idx = get_data(stdDatDir, planet='earth')
+        p2D, th2D = get_grid(lmax=lmax, pad=1, closed=False)
+        self.assertEqual(p2D.shape, nyquist_grid(lmax, pad=1, closed=False))
+        Br = getB(lmax, g, h, idx, 1., p2D, th2D, planet='earth')
+        glm, hlm = anaB(lmax, Br, 1., p2D[:,0], th2D[0,:], planet='earth')
+        np.testing.assert_allclose(glm, g, atol=1e-6)
+
+        theta, nring, phi, th = get_grid_reduced(nphi=32, ntheta=16)
+        self.assertEqual(nring.sum(), len(phi))
+        self.assertLess(nring[0], nring[8])
+        Br = getBrings(lmax, g, h, 0.9, theta, nring, phi, planet='earth')
+        np.testing.assert_allclose(Br, getBpoints(lmax, g, h, 0.9, th, phi, planet='earth')[0], atol=1e-8)
+
+        # a grid that is not a tensor product is evaluated point by point
+        p2D, th2D = get_grid(nphi=16, ntheta=8)
+        p2D = p2D + 0.2*th2D
+        Br = getB(lmax, g, h, idx, 0.9, p2D, th2D, planet='earth')
+        np.testing.assert_allclose(Br, getBpoints(lmax, g, h, 0.9, th2D, p2D, planet='earth')[0], atol=1e-8)
+        with self.assertRaises(ValueError):
+            getB(lmax, np.stack([g, g]), np.stack([h, h]), idx, 0.9, p2D, th2D, planet='earth')
+
+    def test_uncertainty(self):
+        '''
+        Test Monte Carlo against linear propagation of coefficient errors
+        '''
+        p = planet('earth', nphi=32, info=False)
+        sg = 0.01*np.abs(p.glm) + 1.
+        sh = 0.01*np.abs(p.hlm) + 1.
+        Bl, sl = p.Br_uncertainty(0.9, sigma_g=sg, sigma_h=sh)
+        np.testing.assert_allclose(Bl, p.Br_at(0.9), atol=1e-10)
+
+        cov = np.diag(np.concatenate([sg, sh])**2)
+        Bc, sc = p.Br_uncertainty(0.9, cov=cov)
+        np.testing.assert_allclose(sc, sl, rtol=1e-10)
+
+        Bm, sm = p.Br_uncertainty(0.9, sigma_g=sg, sigma_h=sh, K=2000, seed=3)
+        self.assertLess(np.abs(Bm - Bl).max(), 0.2*sl.max())
+        self.assertLess(np.abs(np.median(sm/sl) - 1.), 0.05)
+
+if __name__ == '__main__':
+    unittest.main()